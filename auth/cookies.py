@@ -1,11 +1,146 @@
 """Cookie management for authenticated downloads."""
 
 import os
+import re
+import mmap
+import time
 import shutil
 import logging
-from typing import Dict, Optional
+from functools import lru_cache
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterator, Optional, Tuple
 from datetime import datetime
 
+_log = logging.getLogger(__name__)
+
+# Minimum number of cookie files before list_cookies parses them in a thread pool
+_PARALLEL_LIST_THRESHOLD = 8
+
+_NETSCAPE_HEADER = b'# Netscape HTTP Cookie File'
+
+# Directory listings are only cached once their mtime is this old (ns); an
+# mtime tick is coarse, so a listing taken within it can miss later writes.
+# Shared with the downloaders, which cache the same cookie directory.
+DIR_CACHE_SETTLE_NS = 2_000_000_000
+
+# Session cookie names by platform
+_SESSION_COOKIES = {
+    'instagram': b'sessionid',
+    'facebook': b'c_user',  # Facebook uses c_user for login state
+}
+_DEFAULT_SESSION_COOKIE = b'sessionid'
+
+# Netscape cookie line: domain, flag, path, secure, expiry, name, value
+_EXPIRY_RE = re.compile(
+    rb'(?m)^[^#\n][^\t\n]*\t[^\t\n]*\t[^\t\n]*\t[^\t\n]*\t(\d+)\t([^\t\n]+)\t'
+)
+
+
+def _scan_cookie_lines(lines, platform: str, write=None) -> Tuple[bool, Optional[int]]:
+    """
+    Check Netscape cookie structure and find the session expiry in one pass.
+    
+    Args:
+        lines: Iterable of raw cookie file lines (e.g. a binary file)
+        platform: Platform name
+        write: Optional callable given every line, to copy while scanning
+        
+    Returns:
+        Tuple of (has Netscape header or tab-separated values, expiry unix
+        timestamp or None if the session cookie wasn't found)
+    """
+    target_cookie = _SESSION_COOKIES.get(platform.lower(), _DEFAULT_SESSION_COOKIE)
+    valid = False
+    expiry_unix = None
+    
+    for line in lines:
+        if write:
+            write(line)
+        if not valid:
+            valid = b'\t' in line or _NETSCAPE_HEADER in line
+        if expiry_unix is None:
+            match = _EXPIRY_RE.match(line)
+            if match and match.group(2) == target_cookie:
+                expiry_unix = int(match.group(1))
+    
+    return valid, expiry_unix
+
+
+def _find_session_expiry(data, platform: str) -> Optional[int]:
+    """
+    Find the session cookie expiry timestamp in raw cookie file contents.
+    
+    Args:
+        data: Cookie file contents (bytes or mmap)
+        platform: Platform name
+        
+    Returns:
+        Expiry unix timestamp (0 for session cookies) or None if not found
+    """
+    target_cookie = _SESSION_COOKIES.get(platform.lower(), _DEFAULT_SESSION_COOKIE)
+    
+    for match in _EXPIRY_RE.finditer(data):
+        if match.group(2) == target_cookie:
+            return int(match.group(1))
+    
+    return None
+
+
+@lru_cache(maxsize=512)
+def _parse_expiry_cached(path: str, mtime_ns: int, size: int, platform: str) -> Optional[int]:
+    """
+    Parse the session cookie expiry timestamp from a cookie file.
+    
+    Results are memoized; mtime_ns and size are part of the cache key so a
+    rewritten file is parsed again automatically.
+    
+    Args:
+        path: Path to cookie file
+        mtime_ns: File modification time (cache key only)
+        size: File size in bytes (cache key only)
+        platform: Platform name
+        
+    Returns:
+        Expiry unix timestamp (0 for session cookies) or None if not found
+    """
+    if size == 0:
+        return None
+    
+    with open(path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        return _find_session_expiry(mm, platform)
+
+
+def _expiry_info(expiry_unix: Optional[int], now_ts: Optional[int] = None) -> Dict:
+    """
+    Build the expiry info dict for a session cookie timestamp.
+    
+    Args:
+        expiry_unix: Expiry unix timestamp (0 for session cookies) or None
+        now_ts: Current unix time; pass one value when building many dicts
+        
+    Returns:
+        Dict with expiry_ts, expiry_str and is_expired
+    """
+    if expiry_unix is None:
+        return {'expiry_ts': None, 'expiry_str': 'Unknown', 'is_expired': False}
+    
+    if expiry_unix == 0:
+        return {'expiry_ts': None, 'expiry_str': 'Session (browser close)', 'is_expired': False}
+    
+    try:
+        expiry_str = time.strftime('%Y-%m-%d %H:%M', time.localtime(expiry_unix))
+    except (ValueError, OSError, OverflowError):
+        return {'expiry_ts': None, 'expiry_str': 'Unknown', 'is_expired': False}
+    
+    if now_ts is None:
+        now_ts = int(time.time())
+    
+    return {
+        'expiry_ts': expiry_unix,
+        'expiry_str': expiry_str,
+        'is_expired': expiry_unix < now_ts
+    }
+
 
 class CookieManager:
     """Manage cookie files for authenticated downloads."""
@@ -19,6 +154,10 @@ class CookieManager:
         """
         self.cookie_path = cookie_path
         os.makedirs(cookie_path, exist_ok=True)
+        
+        # Cached cookie filenames, refreshed when the directory mtime changes
+        self._cookie_names: set = set()
+        self._dir_mtime_ns = 0
     
     def save_cookie_file(self, user_id: str, platform: str, file_path: str) -> Dict:
         """
@@ -33,113 +172,120 @@ class CookieManager:
             Dict with success status and expiry info
         """
         try:
-            # Validate cookie file
-            if not self._validate_cookie_file(file_path):
-                return {
-                    'success': False,
-                    'error': 'Invalid cookie file format. Expected Netscape cookie format.'
-                }
-            
-            # Check cookie expiry
-            expiry_info = self._get_cookie_expiry(file_path, platform)
-            
             # Destination path
             dest_file = os.path.join(
                 self.cookie_path,
                 f"{platform.lower()}_{user_id}.txt"
             )
             
-            # Copy file
-            shutil.copy2(file_path, dest_file)
+            # Validate, parse expiry and copy in a single streamed read of the upload
+            valid, expiry_unix = self._read_validate_and_copy(file_path, dest_file, platform)
+            if not valid:
+                return {
+                    'success': False,
+                    'error': 'Invalid cookie file format. Expected Netscape cookie format.'
+                }
+            self._cookie_names.add(os.path.basename(dest_file))
+            
+            expiry_info = _expiry_info(expiry_unix)
+            expiry_ts = expiry_info.get('expiry_ts')
             
-            logging.info(f"✅ Cookie file saved for user {user_id}")
+            _log.info("✅ Cookie file saved for user %s", user_id)
             return {
                 'success': True,
                 'cookie_file': dest_file,
-                'expiry': expiry_info.get('expiry'),
+                'expiry': datetime.fromtimestamp(expiry_ts) if expiry_ts else None,
                 'expiry_str': expiry_info.get('expiry_str'),
                 'is_expired': expiry_info.get('is_expired', False)
             }
             
         except Exception as e:
-            logging.error(f"❌ Failed to save cookie file: {e}")
+            _log.error("❌ Failed to save cookie file: %s", e)
             return {
                 'success': False,
                 'error': str(e)
             }
     
-    def _validate_cookie_file(self, file_path: str) -> bool:
+    def _read_validate_and_copy(self, src_path: str, dest_path: str, platform: str) -> Tuple[bool, Optional[int]]:
         """
-        Validate cookie file format (Netscape format).
+        Validate a cookie file, parse its expiry and write it to dest in one streamed pass.
+        
+        The upload is read line by line exactly once: from a hardlink next to
+        dest when both share a filesystem, otherwise while writing the copy.
         
         Args:
-            file_path: Path to cookie file
+            src_path: Path to uploaded cookie file
+            dest_path: Destination path for the stored cookie file
+            platform: Platform name
             
         Returns:
-            True if valid, False otherwise
+            Tuple of (is_valid, expiry_unix); dest is only written when valid
         """
+        # Stage the new file next to dest and swap it in, so a failed or
+        # invalid upload leaves the previous cookie in place
+        tmp_path = dest_path + '.tmp'
         try:
-            with open(file_path, 'r') as f:
-                content = f.read()
-                # Basic validation: check for cookie structure
-                # Netscape format has tab-separated values
-                return '# Netscape HTTP Cookie File' in content or '\t' in content
-        except Exception:
-            return False
+            os.unlink(tmp_path)
+        except FileNotFoundError:
+            pass
+        try:
+            # Hardlink when src and dest share a filesystem. The link shares the
+            # inode, which is fine because uploads are never modified after saving.
+            try:
+                os.link(src_path, tmp_path)
+                linked = True
+            except OSError:
+                linked = False  # Cross-device (EXDEV) or links unsupported - write a copy
+            
+            with open(src_path, 'rb') as src:
+                if linked:
+                    valid, expiry_unix = _scan_cookie_lines(src, platform)
+                else:
+                    with open(tmp_path, 'wb') as dst:
+                        valid, expiry_unix = _scan_cookie_lines(src, platform, dst.write)
+                    shutil.copystat(src_path, tmp_path)
+            
+            if not valid:
+                os.unlink(tmp_path)
+                return False, None
+            os.replace(tmp_path, dest_path)
+        except BaseException:
+            try:
+                os.unlink(tmp_path)
+            except FileNotFoundError:
+                pass
+            raise
+        
+        return True, expiry_unix
     
-    def _get_cookie_expiry(self, file_path: str, platform: str) -> Dict:
+    def _get_cookie_expiry(
+        self,
+        file_path: str,
+        platform: str,
+        st: Optional[os.stat_result] = None,
+        now_ts: Optional[int] = None
+    ) -> Dict:
         """
         Extract expiry date from session cookie.
         
         Args:
             file_path: Path to cookie file
             platform: Platform name
+            st: Optional pre-fetched stat result (e.g. from os.scandir)
+            now_ts: Optional current unix time shared across a listing
             
         Returns:
             Dict with expiry info
         """
         try:
-            # Session cookie names by platform
-            session_cookies = {
-                'instagram': 'sessionid',
-                'facebook': 'c_user',  # Facebook uses c_user for login state
-            }
-            
-            target_cookie = session_cookies.get(platform.lower(), 'sessionid')
-            
-            with open(file_path, 'r') as f:
-                for line in f:
-                    line = line.strip()
-                    if line.startswith('#') or not line:
-                        continue
-                    
-                    parts = line.split('\t')
-                    if len(parts) >= 7:
-                        cookie_name = parts[5]
-                        expiry_ts = parts[4]
-                        
-                        if cookie_name == target_cookie:
-                            try:
-                                expiry_unix = int(expiry_ts)
-                                if expiry_unix == 0:
-                                    return {'expiry': None, 'expiry_str': 'Session (browser close)', 'is_expired': False}
-                                
-                                expiry_date = datetime.fromtimestamp(expiry_unix)
-                                is_expired = expiry_date < datetime.now()
-                                
-                                return {
-                                    'expiry': expiry_date,
-                                    'expiry_str': expiry_date.strftime('%Y-%m-%d %H:%M'),
-                                    'is_expired': is_expired
-                                }
-                            except (ValueError, OSError):
-                                pass
-            
-            return {'expiry': None, 'expiry_str': 'Unknown', 'is_expired': False}
+            if st is None:
+                st = os.stat(file_path)
+            expiry_unix = _parse_expiry_cached(file_path, st.st_mtime_ns, st.st_size, platform)
+            return _expiry_info(expiry_unix, now_ts)
             
         except Exception as e:
-            logging.warning(f"Could not parse cookie expiry: {e}")
-            return {'expiry': None, 'expiry_str': 'Unknown', 'is_expired': False}
+            _log.warning("Could not parse cookie expiry: %s", e)
+            return {'expiry_ts': None, 'expiry_str': 'Unknown', 'is_expired': False}
     
     def check_cookie_status(self, user_id: str, platform: str) -> Dict:
         """
@@ -152,11 +298,18 @@ class CookieManager:
         Returns:
             Dict with status info
         """
-        cookie_file = self.get_cookie_file(user_id, platform)
-        if not cookie_file:
+        cookie_file = os.path.join(
+            self.cookie_path,
+            f"{platform.lower()}_{user_id}.txt"
+        )
+        
+        # One stat both checks existence and keys the memoized expiry parse
+        try:
+            st = os.stat(cookie_file)
+        except FileNotFoundError:
             return {'exists': False, 'expired': False, 'message': 'No cookie found'}
         
-        expiry_info = self._get_cookie_expiry(cookie_file, platform)
+        expiry_info = self._get_cookie_expiry(cookie_file, platform, st)
         
         if expiry_info.get('is_expired'):
             return {
@@ -184,11 +337,27 @@ class CookieManager:
         Returns:
             Cookie file path or None if not found
         """
-        cookie_file = os.path.join(
-            self.cookie_path,
-            f"{platform.lower()}_{user_id}.txt"
-        )
-        return cookie_file if os.path.exists(cookie_file) else None
+        filename = f"{platform.lower()}_{user_id}.txt"
+        
+        try:
+            dir_mtime_ns = os.stat(self.cookie_path).st_mtime_ns
+        except FileNotFoundError:
+            return None
+        if dir_mtime_ns != self._dir_mtime_ns:
+            self._refresh_cookie_names(dir_mtime_ns)
+        
+        if filename in self._cookie_names:
+            return os.path.join(self.cookie_path, filename)
+        return None
+    
+    def _refresh_cookie_names(self, dir_mtime_ns: int) -> None:
+        """Rebuild the cached set of cookie filenames from the cookie directory."""
+        listed_at = time.time_ns()
+        with os.scandir(self.cookie_path) as it:
+            self._cookie_names = {entry.name for entry in it if entry.name.endswith('.txt')}
+        # Files written by others in the same mtime tick would go unseen, so
+        # an unsettled directory is rescanned on the next lookup
+        self._dir_mtime_ns = dir_mtime_ns if listed_at - dir_mtime_ns > DIR_CACHE_SETTLE_NS else 0
     
     def delete_cookie_file(self, user_id: str, platform: str) -> bool:
         """
@@ -202,11 +371,34 @@ class CookieManager:
             True if deleted, False if not found
         """
         cookie_file = self.get_cookie_file(user_id, platform)
-        if cookie_file and os.path.exists(cookie_file):
+        if not cookie_file:
+            return False
+        
+        self._cookie_names.discard(os.path.basename(cookie_file))
+        try:
             os.remove(cookie_file)
-            logging.info(f"🗑️ Deleted cookie file for user {user_id}")
-            return True
-        return False
+        except FileNotFoundError:
+            return False
+        
+        _log.info("🗑️ Deleted cookie file for user %s", user_id)
+        return True
+    
+    def iter_cookies(self, user_id: Optional[str] = None) -> Iterator[Dict]:
+        """
+        Lazily yield cookie file info, optionally filtered by user.
+        
+        Entries are parsed one at a time as the directory is scanned, so
+        memory use does not grow with the number of cookie files.
+        
+        Args:
+            user_id: Optional user ID to filter by
+            
+        Yields:
+            Cookie file info dicts with expiry info
+        """
+        now_ts = int(time.time())
+        for match in self._iter_cookie_entries(user_id):
+            yield self._cookie_info(match, now_ts)
     
     def list_cookies(self, user_id: Optional[str] = None) -> list:
         """
@@ -218,20 +410,36 @@ class CookieManager:
         Returns:
             List of cookie file info dicts with expiry info
         """
-        cookies = []
-        for filename in os.listdir(self.cookie_path):
-            if filename.endswith('.txt'):
-                parts = filename[:-4].split('_', 1)  # Remove .txt and split
+        matches = list(self._iter_cookie_entries(user_id))
+        now_ts = int(time.time())
+        
+        # Parse in parallel only when there are enough files to amortize the pool
+        if len(matches) < _PARALLEL_LIST_THRESHOLD:
+            return [self._cookie_info(match, now_ts) for match in matches]
+        
+        with ThreadPoolExecutor(max_workers=min(32, len(matches))) as executor:
+            return list(executor.map(self._cookie_info, matches, [now_ts] * len(matches)))
+    
+    def _iter_cookie_entries(self, user_id: Optional[str]) -> Iterator[tuple]:
+        """Yield (platform, user_id, path, stat) for cookie files in the directory."""
+        with os.scandir(self.cookie_path) as it:
+            for entry in it:
+                if not entry.name.endswith('.txt') or not entry.is_file(follow_symlinks=False):
+                    continue
+                parts = entry.name[:-4].split('_', 1)  # Remove .txt and split
                 if len(parts) == 2:
                     platform, uid = parts
                     if user_id is None or uid == user_id:
-                        cookie_path = os.path.join(self.cookie_path, filename)
-                        expiry_info = self._get_cookie_expiry(cookie_path, platform)
-                        cookies.append({
-                            'platform': platform,
-                            'user_id': uid,
-                            'path': cookie_path,
-                            'expiry_str': expiry_info.get('expiry_str', 'Unknown'),
-                            'is_expired': expiry_info.get('is_expired', False)
-                        })
-        return cookies
+                        yield platform, uid, entry.path, entry.stat()
+    
+    def _cookie_info(self, match: tuple, now_ts: int) -> Dict:
+        """Build the cookie info dict for an entry from _iter_cookie_entries."""
+        platform, uid, path, st = match
+        expiry_info = self._get_cookie_expiry(path, platform, st, now_ts)
+        return {
+            'platform': platform,
+            'user_id': uid,
+            'path': path,
+            'expiry_str': expiry_info.get('expiry_str', 'Unknown'),
+            'is_expired': expiry_info.get('is_expired', False)
+        }
@@ -13,6 +13,15 @@ except ImportError:
     PYROGRAM_AVAILABLE = False
     Client = None
 
+_log = logging.getLogger(__name__)
+
+# Read buffer for uploads: MTProto sends 512 KiB parts, so each read syscall
+# serves two parts instead of one.
+UPLOAD_READ_BUFFER = 1024 * 1024
+
+# Extensions sent with send_video; everything else goes as a document
+VIDEO_EXTENSIONS = frozenset({'.mp4', '.mov', '.avi', '.mkv', '.webm'})
+
 
 class MTProtoClient:
     """
@@ -42,12 +51,26 @@ class MTProtoClient:
         self.client: Optional[Client] = None
         self._is_connected = False
         
+        # Credentials are fixed after construction, so resolve them once.
+        # Reassigning api_id/api_hash later requires refreshing these fields.
+        self._api_id_int: Optional[int] = None
+        if self.api_id:
+            try:
+                self._api_id_int = int(self.api_id)
+            except ValueError:
+                _log.warning("⚠️ TELEGRAM_API_ID must be numeric, got %r", self.api_id)
+        self._is_configured = bool(self._api_id_int and self.api_hash and PYROGRAM_AVAILABLE)
+        
+        # Default progress logging state (bytes between log lines, last logged)
+        self._progress_step = 0
+        self._progress_logged = 0
+        
         os.makedirs(session_path, exist_ok=True)
     
     @property
     def is_configured(self) -> bool:
         """Check if MTProto credentials are configured."""
-        return bool(self.api_id and self.api_hash and PYROGRAM_AVAILABLE)
+        return self._is_configured
     
     @property
     def is_connected(self) -> bool:
@@ -62,11 +85,11 @@ class MTProtoClient:
             True if started successfully, False otherwise
         """
         if not PYROGRAM_AVAILABLE:
-            logging.warning("⚠️ Pyrogram not installed. Run: pip install pyrogram")
+            _log.warning("⚠️ Pyrogram not installed. Run: pip install pyrogram")
             return False
         
         if not self.is_configured:
-            logging.warning("⚠️ MTProto not configured. Set TELEGRAM_API_ID and TELEGRAM_API_HASH")
+            _log.warning("⚠️ MTProto not configured. Set TELEGRAM_API_ID and TELEGRAM_API_HASH")
             return False
         
         try:
@@ -74,7 +97,7 @@ class MTProtoClient:
             
             self.client = Client(
                 session_file,
-                api_id=int(self.api_id),
+                api_id=self._api_id_int,
                 api_hash=self.api_hash,
             )
             
@@ -82,11 +105,11 @@ class MTProtoClient:
             self._is_connected = True
             
             me = await self.client.get_me()
-            logging.info(f"✅ MTProto connected as {me.first_name} (@{me.username})")
+            _log.info("✅ MTProto connected as %s (@%s)", me.first_name, me.username)
             return True
             
         except Exception as e:
-            logging.error(f"❌ MTProto connection failed: {e}")
+            _log.error("❌ MTProto connection failed: %s", e)
             self._is_connected = False
             return False
     
@@ -95,7 +118,7 @@ class MTProtoClient:
         if self.client and self._is_connected:
             await self.client.stop()
             self._is_connected = False
-            logging.info("📴 MTProto disconnected")
+            _log.info("📴 MTProto disconnected")
     
     async def upload_file(
         self,
@@ -117,48 +140,65 @@ class MTProtoClient:
             True if upload successful, False otherwise
         """
         if not self.is_connected:
-            logging.error("❌ MTProto not connected")
+            _log.error("❌ MTProto not connected")
             return False
         
         try:
-            file_size_mb = os.path.getsize(file_path) / (1024 * 1024)
-            logging.info(f"📤 MTProto uploading {file_size_mb:.1f}MB file...")
+            file_size = os.stat(file_path).st_size
+            file_size_mb = file_size / (1024 * 1024)
+            _log.info("📤 MTProto uploading %.1fMB file...", file_size_mb)
             
             # Determine if video or document
-            ext = os.path.splitext(file_path)[1].lower()
-            is_video = ext in ['.mp4', '.mov', '.avi', '.mkv', '.webm']
+            dot = file_path.rfind('.')
+            ext = file_path[dot:].lower() if dot > file_path.rfind(os.sep) else ''
+            is_video = ext in VIDEO_EXTENSIONS
             
-            if is_video:
-                await self.client.send_video(
-                    chat_id=chat_id,
-                    video=file_path,
-                    caption=caption,
-                    progress=progress_callback or self._default_progress
-                )
-            else:
-                await self.client.send_document(
-                    chat_id=chat_id,
-                    document=file_path,
-                    caption=caption,
-                    progress=progress_callback or self._default_progress
-                )
+            file_name = os.path.basename(file_path)
+            progress = progress_callback or self._default_progress
+            self._progress_step = max(file_size // 10, 1)
+            self._progress_logged = 0
             
-            logging.info(f"✅ MTProto upload complete!")
+            # Stream from a buffered handle so large files are read in 1 MiB chunks
+            with open(file_path, 'rb', buffering=UPLOAD_READ_BUFFER) as f:
+                if is_video:
+                    await self.client.send_video(
+                        chat_id=chat_id,
+                        video=f,
+                        file_name=file_name,
+                        caption=caption,
+                        progress=progress
+                    )
+                else:
+                    await self.client.send_document(
+                        chat_id=chat_id,
+                        document=f,
+                        file_name=file_name,
+                        caption=caption,
+                        progress=progress
+                    )
+            
+            _log.info("✅ MTProto upload complete!")
             return True
             
         except Exception as e:
-            logging.error(f"❌ MTProto upload failed: {e}")
+            _log.error("❌ MTProto upload failed: %s", e)
             return False
 
     async def _default_progress(self, current, total):
-        """Default progress callback for uploads."""
-        try:
-            percent = current * 100 / total
-            # Log every 10% to avoid spam
-            if int(percent) % 10 == 0 and int(percent) > 0:
-                logging.info(f"📤 Uploading: {percent:.1f}% ({current/1024/1024:.1f}/{total/1024/1024:.1f} MB)")
-        except:
-            pass
+        """Default progress callback for uploads (logs roughly every 10%)."""
+        if not self._progress_step:
+            self._progress_step = max(total // 10, 1)
+        
+        # Common path: a single comparison, no formatting
+        if current - self._progress_logged < self._progress_step:
+            return
+        self._progress_logged = current
+        
+        if _log.isEnabledFor(logging.INFO):
+            _log.info(
+                "📤 Uploading: %.1f%% (%.1f/%.1f MB)",
+                current * 100 / total, current / 1024 / 1024, total / 1024 / 1024
+            )
 
 
 
@@ -184,7 +224,7 @@ async def init_mtproto() -> Optional[MTProtoClient]:
     _mtproto_client = MTProtoClient()
     
     if not _mtproto_client.is_configured:
-        logging.info("ℹ️ MTProto not configured (optional - for files >50MB)")
+        _log.info("ℹ️ MTProto not configured (optional - for files >50MB)")
         return None
     
     success = await _mtproto_client.start()
@@ -1,13 +1,31 @@
 """Telegram bot for StoryFlow media downloader."""
 
 import os
+import re
+import html
 import logging
 import asyncio
+import itertools
+import tempfile
 import time
-from typing import Optional
+from functools import lru_cache
+from pathlib import Path
+from typing import TYPE_CHECKING, AsyncIterator, Dict, Iterator, List, NamedTuple, Optional, Tuple
 
-from telegram import Update, Document, InlineKeyboardButton, InlineKeyboardMarkup
+from cachetools import TTLCache
+
+from telegram import (
+    Update,
+    Document,
+    InlineKeyboardButton,
+    InlineKeyboardMarkup,
+    InputMediaPhoto,
+    InputMediaVideo
+)
+from telegram.constants import ParseMode
+from telegram.error import RetryAfter
 from telegram.ext import (
+    AIORateLimiter,
     Application,
     CommandHandler,
     MessageHandler,
@@ -18,28 +36,39 @@ from telegram.ext import (
 
 from core.platform import identify_platform, extract_snapchat_username
 from core.queue import DownloadQueue, JobStatus, init_queue, get_queue
-from downloaders.snapchat import SnapchatDownloader
-from downloaders.gallery_dl import GalleryDLDownloader
 from auth.cookies import CookieManager
 from core.stats import stats_manager
 
+# Downloaders are imported in run_telegram_bot so importing this module stays light
+if TYPE_CHECKING:
+    from downloaders.snapchat import SnapchatDownloader
+    from downloaders.gallery_dl import GalleryDLDownloader
+
+_log = logging.getLogger(__name__)
+
 # MTProto import (optional - for large files >50MB)
 try:
     from auth.mtproto import MTProtoClient, get_mtproto_client, init_mtproto
     MTPROTO_AVAILABLE = True
 except Exception as e:
-    logging.warning(f"MTProto not available: {e}")
+    _log.warning("MTProto not available: %s", e)
     MTProtoClient = None
     get_mtproto_client = lambda: None
     init_mtproto = None
     MTPROTO_AVAILABLE = False
 
+# uvloop import (optional - faster event loop, not available on Windows)
+try:
+    import uvloop
+    UVLOOP_AVAILABLE = True
+except ImportError:
+    uvloop = None
+    UVLOOP_AVAILABLE = False
 
-import random
 
 # Initialize components
-snapchat: Optional[SnapchatDownloader] = None
-gallery_dl: Optional[GalleryDLDownloader] = None
+snapchat: Optional["SnapchatDownloader"] = None
+gallery_dl: Optional["GalleryDLDownloader"] = None
 cookie_manager: Optional[CookieManager] = None
 mtproto_client: Optional[MTProtoClient] = None
 
@@ -61,8 +90,116 @@ PROCESSING_MSGS = [
     "⚡ One moment please..."
 ]
 
+# Round-robin through processing messages (no PRNG call per URL)
+_PROC_CYCLE = itertools.cycle(PROCESSING_MSGS)
+
+# Emoji shown next to each platform in status messages
+PLATFORM_EMOJI = {"Instagram": "📸", "TikTok": "🎵", "Twitter": "🐦", "Facebook": "📘", "Snapchat": "👻"}
+COOKIE_PLATFORM_EMOJI = {'instagram': "📸", 'facebook': "📘"}
+
+# Updates handled at once (album buffering needs the rest of an album to be
+# processed while its first document waits)
+MAX_CONCURRENT_UPDATES = 16
+
+# Bytes of read-ahead media kept in memory per upload job (PTB loads every
+# InputMedia file fully); one batch is always allowed, however large
+MAX_INFLIGHT_UPLOAD_BYTES = 100 * 1024 * 1024
+
+# Minimum seconds between per-batch progress edits of the status message
+STATUS_EDIT_INTERVAL = 3.0
+
+# Window in which rapid status edits to one message are coalesced
+STATUS_EDIT_DEBOUNCE = 0.4
+
+# Supported extensions for media groups
+PHOTO_EXTS = frozenset({'.jpg', '.jpeg', '.png', '.webp', '.gif'})
+VIDEO_EXTS = frozenset({'.mp4', '.mov', '.webm', '.avi', '.mkv', '.m4v'})
+
+# Extension -> media group class (one lookup per file)
+EXT_TO_MEDIA = {
+    **{ext: InputMediaPhoto for ext in PHOTO_EXTS},
+    **{ext: InputMediaVideo for ext in VIDEO_EXTS},
+}
+
+# Per-user cookie listings, invalidated on save/delete. The TTL only has to
+# cover one menu interaction; keep it short so expiry labels stay current.
+COOKIE_LIST_CACHE: TTLCache = TTLCache(maxsize=1024, ttl=5)
+
+# Documents from the same album (media_group_id -> updates), flushed after a short delay
+MEDIA_GROUP_BUFFER: Dict[str, list] = {}
+MEDIA_GROUP_FLUSH_DELAY = 1.5
+
+class HttpUrlFilter(filters.MessageFilter):
+    """Match messages whose text starts with http:// or https://."""
+    
+    def filter(self, message) -> bool:
+        # C-level prefix compare; cheaper than running a regex per message
+        return bool(message.text) and message.text.startswith(('http://', 'https://'))
+
+
+# URL messages routed to handle_url
+URL_FILTER = HttpUrlFilter()
+
+# Error text that suggests Telegram flood control
+FLOOD_RE = re.compile(r'flood|retry', re.IGNORECASE)
+
 # Map job_id -> status_message object for updates
-JOB_MESSAGES = {}
+# (bounded, so jobs that never reach a final state can't leak messages)
+JOB_MESSAGES: TTLCache = TTLCache(maxsize=10000, ttl=3600)
+
+# Debounced status edits: (chat_id, message_id) -> latest (text, kwargs) / flush task
+PENDING_EDITS: Dict[Tuple[int, int], Tuple[str, dict]] = {}
+_EDIT_TASKS: Dict[Tuple[int, int], asyncio.Task] = {}
+
+
+async def _flush_status_edits(status_msg, key: Tuple[int, int]) -> None:
+    """Send the latest pending text for a message once each debounce window ends."""
+    try:
+        while True:
+            await asyncio.sleep(STATUS_EDIT_DEBOUNCE)
+            pending = PENDING_EDITS.pop(key, None)
+            if pending is None:
+                break
+            text, kwargs = pending
+            try:
+                await status_msg.edit_text(text, **kwargs)
+            except Exception as e:
+                _log.warning("Failed to apply status edit: %s", e)
+    finally:
+        if _EDIT_TASKS.get(key) is asyncio.current_task():
+            del _EDIT_TASKS[key]
+
+
+async def edit_status(status_msg, text: str, immediate: bool = False, **kwargs) -> None:
+    """
+    Edit a status message, coalescing bursts of updates.
+    
+    Regular edits are held for STATUS_EDIT_DEBOUNCE seconds and only the
+    latest text is sent, so quick queued -> downloading -> uploading
+    transitions cost one API call instead of several.
+    
+    Args:
+        status_msg: Message to edit
+        text: New message text
+        immediate: Send now and drop anything pending (use for final states
+            so a stale progress edit can't land on top of them)
+        **kwargs: Passed through to edit_text (parse_mode, reply_markup...)
+    """
+    key = (status_msg.chat_id, status_msg.message_id)
+    
+    if immediate:
+        PENDING_EDITS.pop(key, None)
+        task = _EDIT_TASKS.pop(key, None)
+        if task:
+            task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
+        await status_msg.edit_text(text, **kwargs)
+        return
+    
+    PENDING_EDITS[key] = (text, kwargs)
+    if key not in _EDIT_TASKS:
+        _EDIT_TASKS[key] = asyncio.create_task(_flush_status_edits(status_msg, key))
+
 
 async def queue_status_callback(job):
     """Callback for queue status updates."""
@@ -71,20 +208,19 @@ async def queue_status_callback(job):
         return
 
     try:
-        platform_emoji = {"Instagram": "📸", "TikTok": "🎵", "Twitter": "🐦", "Facebook": "📘", "Snapchat": "👻"}
-        emoji = platform_emoji.get(job.platform, "📥")
+        emoji = PLATFORM_EMOJI.get(job.platform, "📥")
         
         if job.status.value == "queued":
             # Show queue position
             pos = get_queue().get_queue_position(job.job_id)
-            await status_msg.edit_text(f"⏳ *Queued* (Position: {pos})\nWaiting for available worker...", parse_mode='Markdown')
+            await edit_status(status_msg, f"⏳ <b>Queued</b> (Position: {pos})\nWaiting for available worker...", parse_mode=ParseMode.HTML)
             
         elif job.status.value == "downloading":
-            await status_msg.edit_text(f"⬇️ *Downloading...*\n{emoji} Grabbing {job.platform} content", parse_mode='Markdown')
+            await edit_status(status_msg, f"⬇️ <b>Downloading...</b>\n{emoji} Grabbing {job.platform} content", parse_mode=ParseMode.HTML)
             
         elif job.status.value == "uploading":
             # Batch upload handles its own status updates, but we set a generic one just in case
-            # await status_msg.edit_text(f"🚀 *Uploading...*\nPreparing to send files...", parse_mode='Markdown')
+            # await status_msg.edit_text(f"🚀 <b>Uploading...</b>\nPreparing to send files...", parse_mode=ParseMode.HTML)
             pass
             
         elif job.status.value == "completed":
@@ -92,20 +228,117 @@ async def queue_status_callback(job):
             stats_manager.increment_download(job.user_id, job.platform)
             
             # Final cleanup
-            if job.job_id in JOB_MESSAGES:
-                del JOB_MESSAGES[job.job_id]
+            JOB_MESSAGES.pop(job.job_id, None)
                 
         elif job.status.value == "failed":
-            await status_msg.edit_text(f"❌ *Failed*\n{job.error}", parse_mode='Markdown')
-            if job.job_id in JOB_MESSAGES:
-                del JOB_MESSAGES[job.job_id]
+            await edit_status(status_msg, f"❌ <b>Failed</b>\n{html.escape(str(job.error))}", immediate=True, parse_mode=ParseMode.HTML)
+            JOB_MESSAGES.pop(job.job_id, None)
                 
     except Exception as e:
-        logging.error(f"Failed to update status message for job {job.job_id}: {e}")
+        _log.error("Failed to update status message for job %s: %s", job.job_id, e)
 
 
 # ============= MAIN MENU & NAVIGATION =============
 
+# Static menu texts and keyboards, built once at import
+MAIN_MENU_TEXT = (
+    "🎬 <b>StoryFlow Downloader</b>\n\n"
+    "I can download stories, reels, and videos from:\n"
+    "👻 Snapchat • 📸 Instagram • 🎵 TikTok\n"
+    "🐦 Twitter/X • 📘 Facebook\n\n"
+    "👇 <b>Tap a button to get started!</b>"
+)
+
+MAIN_MENU_KEYBOARD = InlineKeyboardMarkup([
+    [InlineKeyboardButton("❓ Help & Usage", callback_data="menu_help")],
+    [InlineKeyboardButton("📊 My Stats", callback_data="menu_stats"),
+     InlineKeyboardButton("🍪 Manage Cookies", callback_data="menu_cookies")],
+])
+
+HELP_TEXT = (
+    "📖 <b>How to Use StoryFlow</b>\n\n"
+    "1️⃣ Copy a link from any supported platform\n"
+    "2️⃣ Paste it here\n"
+    "3️⃣ I'll download and send it back!\n\n"
+    "<b>Available Commands:</b>\n"
+    "• /start - Main menu\n"
+    "• /help - Usage guide\n"
+    "• /my_cookies - Manage login cookies\n"
+    "• /purge - ⚠️ Delete all downloaded files (Maintenance)\n\n"
+    "<i>Tap a platform for specific tips:</i>"
+)
+
+HELP_KEYBOARD = InlineKeyboardMarkup([
+    [InlineKeyboardButton("👻 Snapchat", callback_data="help_snapchat"),
+     InlineKeyboardButton("📸 Instagram", callback_data="help_instagram")],
+    [InlineKeyboardButton("🎵 TikTok", callback_data="help_tiktok"),
+     InlineKeyboardButton("📘 Facebook", callback_data="help_facebook")],
+    [InlineKeyboardButton("🐦 Twitter/X", callback_data="help_twitter"),
+     InlineKeyboardButton("⚠️ Purge System", callback_data="menu_purge_confirm")],
+    [InlineKeyboardButton("⬅️ Main Menu", callback_data="menu_main")],
+])
+
+COOKIES_EMPTY_TEXT = (
+    "🍪 <b>Cookie Manager</b>\n\n"
+    "No cookies saved yet!\n\n"
+    "Cookies let you download content that requires login\n"
+    "(like Instagram stories or Facebook reels)."
+)
+
+COOKIES_MENU_KEYBOARD = InlineKeyboardMarkup([
+    [InlineKeyboardButton("📸 Add Instagram", callback_data="cookies_instagram"),
+     InlineKeyboardButton("📘 Add Facebook", callback_data="cookies_facebook")],
+    [InlineKeyboardButton("🗑️ Delete Cookies", callback_data="menu_delete_cookies")],
+    [InlineKeyboardButton("⬅️ Main Menu", callback_data="menu_main")],
+])
+
+STATS_KEYBOARD = InlineKeyboardMarkup([
+    [InlineKeyboardButton("⬅️ Main Menu", callback_data="menu_main")],
+])
+
+BACK_TO_HELP_KEYBOARD = InlineKeyboardMarkup([
+    [InlineKeyboardButton("⬅️ Back to Help", callback_data="menu_help")],
+])
+
+HELP_INSTAGRAM_KEYBOARD = InlineKeyboardMarkup([
+    [InlineKeyboardButton("🍪 Add Instagram Cookies", callback_data="cookies_instagram")],
+    [InlineKeyboardButton("⬅️ Back to Help", callback_data="menu_help")],
+])
+
+HELP_FACEBOOK_KEYBOARD = InlineKeyboardMarkup([
+    [InlineKeyboardButton("🍪 Add Facebook Cookies", callback_data="cookies_facebook")],
+    [InlineKeyboardButton("⬅️ Back to Help", callback_data="menu_help")],
+])
+
+PURGE_CONFIRM_KEYBOARD = InlineKeyboardMarkup([
+    [InlineKeyboardButton("🗑️ Yes, Purge Everything", callback_data="menu_purge_execute")],
+    [InlineKeyboardButton("⬅️ No, Go Back", callback_data="menu_help")],
+])
+
+COOKIE_UPLOAD_KEYBOARD = InlineKeyboardMarkup([
+    [InlineKeyboardButton("❌ Cancel", callback_data="menu_cookies")],
+])
+
+DELETE_COOKIES_KEYBOARD = InlineKeyboardMarkup([
+    [InlineKeyboardButton("📸 Instagram", callback_data="delete_instagram"),
+     InlineKeyboardButton("📘 Facebook", callback_data="delete_facebook")],
+    [InlineKeyboardButton("⚠️ Delete All", callback_data="delete_all")],
+    [InlineKeyboardButton("⬅️ Back", callback_data="menu_cookies")],
+])
+
+BACK_TO_COOKIES_KEYBOARD = InlineKeyboardMarkup([
+    [InlineKeyboardButton("⬅️ Back to Cookies", callback_data="menu_cookies")],
+])
+
+DELETE_COOKIES_COMMAND_KEYBOARD = InlineKeyboardMarkup([
+    [InlineKeyboardButton("📸 Instagram", callback_data="delete_instagram"),
+     InlineKeyboardButton("📘 Facebook", callback_data="delete_facebook")],
+    [InlineKeyboardButton("⚠️ Delete All", callback_data="delete_all")],
+    [InlineKeyboardButton("⬅️ Main Menu", callback_data="menu_main")],
+])
+
+
+@lru_cache(maxsize=1)
 def get_main_menu_keyboard():
     """Get the main menu inline keyboard."""
     return InlineKeyboardMarkup([
@@ -115,30 +348,21 @@ def get_main_menu_keyboard():
     ])
 
 
+@lru_cache(maxsize=16)
 def get_back_button(callback_data: str = "menu_main"):
     """Get a back button."""
     return InlineKeyboardMarkup([[InlineKeyboardButton("⬅️ Back", callback_data=callback_data)]])
 
 
+async def _send_or_edit(target, text: str, keyboard: InlineKeyboardMarkup, is_new_message: bool) -> None:
+    """Reply with an HTML menu page, or edit it into the message in place."""
+    send = target.reply_text if is_new_message else target.edit_message_text
+    await send(text, parse_mode=ParseMode.HTML, reply_markup=keyboard)
+
+
 async def send_main_menu(target, is_new_message: bool = True):
     """Send or edit the main menu."""
-    text = (
-        "🎬 *StoryFlow Downloader*\n\n"
-        "I can download stories, reels, and videos from:\n"
-        "👻 Snapchat • 📸 Instagram • 🎵 TikTok\n"
-        "🐦 Twitter/X • 📘 Facebook\n\n"
-        "👇 *Tap a button to get started!*"
-    )
-    keyboard = InlineKeyboardMarkup([
-        [InlineKeyboardButton("❓ Help & Usage", callback_data="menu_help")],
-        [InlineKeyboardButton("📊 My Stats", callback_data="menu_stats"),
-         InlineKeyboardButton("🍪 Manage Cookies", callback_data="menu_cookies")],
-    ])
-    
-    if is_new_message:
-        await target.reply_text(text, parse_mode='Markdown', reply_markup=keyboard)
-    else:
-        await target.edit_message_text(text, parse_mode='Markdown', reply_markup=keyboard)
+    await _send_or_edit(target, MAIN_MENU_TEXT, MAIN_MENU_KEYBOARD, is_new_message)
 
 
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
@@ -153,289 +377,268 @@ async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> No
 
 async def send_help_menu(target, is_new_message: bool = True):
     """Send or edit the help menu."""
-    text = (
-        "📖 *How to Use StoryFlow*\n\n"
-        "1️⃣ Copy a link from any supported platform\n"
-        "2️⃣ Paste it here\n"
-        "3️⃣ I'll download and send it back!\n\n"
-        "*Available Commands:*\n"
-        "• /start - Main menu\n"
-        "• /help - Usage guide\n"
-        "• /my\_cookies - Manage login cookies\n"
-        "• /purge - ⚠️ Delete all downloaded files (Maintenance)\n\n"
-        "_Tap a platform for specific tips:_"
+    await _send_or_edit(target, HELP_TEXT, HELP_KEYBOARD, is_new_message)
+
+
+def get_user_cookies(user_id: str) -> list:
+    """List a user's cookies, served from COOKIE_LIST_CACHE when fresh."""
+    cookies = COOKIE_LIST_CACHE.get(user_id)
+    if cookies is None:
+        # A user has one file per platform, too few for list_cookies' thread pool
+        cookies = list(cookie_manager.iter_cookies(user_id)) if cookie_manager else []
+        COOKIE_LIST_CACHE[user_id] = cookies
+    return cookies
+
+
+@lru_cache(maxsize=512)
+def _render_cookies_text(key: Tuple[Tuple[str, bool, str], ...]) -> str:
+    """Render the cookie menu text for a tuple of (platform, is_expired, expiry_str)."""
+    if not key:
+        return COOKIES_EMPTY_TEXT
+    
+    return "🍪 <b>Your Cookies</b>\n\n" + "\n".join(
+        f"{COOKIE_PLATFORM_EMOJI.get(platform, '🍪')} {platform.title()}: "
+        f"{'⚠️ Expired' if is_expired else '✅ Active'}\n"
+        f"   📅 {expiry_str}\n"
+        for platform, is_expired, expiry_str in key
     )
-    keyboard = InlineKeyboardMarkup([
-        [InlineKeyboardButton("👻 Snapchat", callback_data="help_snapchat"),
-         InlineKeyboardButton("📸 Instagram", callback_data="help_instagram")],
-        [InlineKeyboardButton("🎵 TikTok", callback_data="help_tiktok"),
-         InlineKeyboardButton("📘 Facebook", callback_data="help_facebook")],
-        [InlineKeyboardButton("🐦 Twitter/X", callback_data="help_twitter"),
-         InlineKeyboardButton("⚠️ Purge System", callback_data="menu_purge_confirm")],
-        [InlineKeyboardButton("⬅️ Main Menu", callback_data="menu_main")],
-    ])
+
+
+def _format_cookies_text(cookies: list) -> str:
+    """Build the cookie menu text from iter_cookies() entries."""
+    key = tuple(
+        (c['platform'], bool(c.get('is_expired')), c.get('expiry_str', 'Unknown'))
+        for c in cookies
+    )
+    return _render_cookies_text(key)
+
+
+async def send_cookies_menu(target, user_id: str, is_new_message: bool = False):
+    """Send or edit the cookie management menu."""
+    text = _format_cookies_text(get_user_cookies(user_id))
+    await _send_or_edit(target, text, COOKIES_MENU_KEYBOARD, is_new_message)
+
+
+
+# ============= CALLBACK PAGES & HANDLERS =============
+
+HELP_SNAPCHAT_TEXT = (
+    "👻 <b>Snapchat Tips</b>\n\n"
+    "Send me a profile link like:\n"
+    "<code>snapchat.com/add/username</code>\n\n"
+    "I'll grab ALL their public stories!\n\n"
+    "💡 <i>No cookies needed for Snapchat</i>"
+)
+
+HELP_INSTAGRAM_TEXT = (
+    "📸 <b>Instagram Tips</b>\n\n"
+    "• <b>Public posts/reels</b>: Just send the link\n"
+    "• <b>Stories/Private</b>: Need cookies first\n\n"
+    "Example links:\n"
+    "<code>instagram.com/p/ABC123</code>\n"
+    "<code>instagram.com/reel/XYZ789</code>\n\n"
+    "💡 <i>Use 'Manage Cookies' to add login cookies</i>"
+)
+
+HELP_TIKTOK_TEXT = (
+    "🎵 <b>TikTok Tips</b>\n\n"
+    "Just send a TikTok video link:\n"
+    "<code>tiktok.com/@user/video/123</code>\n\n"
+    "I'll download it without watermark!\n\n"
+    "💡 <i>No cookies needed for most videos</i>"
+)
+
+HELP_FACEBOOK_TEXT = (
+    "📘 <b>Facebook Tips</b>\n\n"
+    "• <b>Public videos</b>: Just send the link\n"
+    "• <b>Reels/Private</b>: Need cookies first\n\n"
+    "Example link:\n"
+    "<code>facebook.com/watch/?v=123</code>\n\n"
+    "💡 <i>Many Facebook videos require login cookies</i>"
+)
+
+HELP_TWITTER_TEXT = (
+    "🐦 <b>Twitter/X Tips</b>\n\n"
+    "Send me a tweet link:\n"
+    "<code>x.com/user/status/123...</code>\n"
+    "<code>twitter.com/user/status/123...</code>\n\n"
+    "I'll download the video or images!\n\n"
+    "💡 <i>No cookies needed usually</i>"
+)
+
+PURGE_CONFIRM_TEXT = (
+    "⚠️ <b>System Purge - Warning</b>\n\n"
+    "This will delete ALL downloaded files from the server.\n"
+    "This is useful if storage is full or downloads are stuck.\n\n"
+    "<b>Are you sure?</b>"
+)
+
+DELETE_COOKIES_TEXT = (
+    "🗑️ <b>Delete Cookies</b>\n\n"
+    "Which cookies would you like to delete?"
+)
+
+# Upload instructions per cookie platform (cookies_<platform> buttons)
+COOKIE_UPLOAD_TEXTS = {
+    'instagram': (
+        "📸 <b>Upload Instagram Cookies</b>\n\n"
+        "Send me your <code>cookies.txt</code> file from Instagram.\n\n"
+        "<b>How to get it:</b>\n"
+        "1. Install 'Get cookies.txt' extension\n"
+        "2. Go to instagram.com (logged in)\n"
+        "3. Export cookies\n"
+        "4. Send the file here\n\n"
+        "<i>Waiting for your file...</i>"
+    ),
+    'facebook': (
+        "📘 <b>Upload Facebook Cookies</b>\n\n"
+        "Send me your <code>cookies.txt</code> file from Facebook.\n\n"
+        "<b>How to get it:</b>\n"
+        "1. Install 'Get cookies.txt' extension\n"
+        "2. Go to facebook.com (logged in)\n"
+        "3. Export cookies\n"
+        "4. Send the file here\n\n"
+        "<i>Waiting for your file...</i>"
+    ),
+}
+
+# Callbacks that only show a fixed page: callback_data -> (text, keyboard)
+STATIC_PAGES = {
+    "help_snapchat": (HELP_SNAPCHAT_TEXT, BACK_TO_HELP_KEYBOARD),
+    "help_instagram": (HELP_INSTAGRAM_TEXT, HELP_INSTAGRAM_KEYBOARD),
+    "help_tiktok": (HELP_TIKTOK_TEXT, BACK_TO_HELP_KEYBOARD),
+    "help_facebook": (HELP_FACEBOOK_TEXT, HELP_FACEBOOK_KEYBOARD),
+    "help_twitter": (HELP_TWITTER_TEXT, BACK_TO_HELP_KEYBOARD),
+    "menu_purge_confirm": (PURGE_CONFIRM_TEXT, PURGE_CONFIRM_KEYBOARD),
+    "menu_delete_cookies": (DELETE_COOKIES_TEXT, DELETE_COOKIES_KEYBOARD),
+}
+
+
+async def _cb_menu_main(query, context: ContextTypes.DEFAULT_TYPE, user_id: str) -> None:
+    await send_main_menu(query, is_new_message=False)
+
+
+async def _cb_menu_help(query, context: ContextTypes.DEFAULT_TYPE, user_id: str) -> None:
+    await send_help_menu(query, is_new_message=False)
+
+
+async def _cb_menu_cookies(query, context: ContextTypes.DEFAULT_TYPE, user_id: str) -> None:
+    await send_cookies_menu(query, user_id)
+
+
+async def _cb_menu_stats(query, context: ContextTypes.DEFAULT_TYPE, user_id: str) -> None:
+    stats = stats_manager.get_user_stats(user_id)
+    total = stats.get('total_downloads', 0)
+    platforms = stats.get('platforms', {})
     
-    if is_new_message:
-        await target.reply_text(text, parse_mode='Markdown', reply_markup=keyboard)
+    # Build platform breakdown
+    if platforms:
+        breakdown = "\n".join(f"• {p}: {c}" for p, c in platforms.items())
     else:
-        await target.edit_message_text(text, parse_mode='Markdown', reply_markup=keyboard)
-
-
-async def send_cookies_menu(target, user_id: str):
-    """Send the cookie management menu."""
-    # Check existing cookies
-    cookies = cookie_manager.list_cookies(user_id) if cookie_manager else []
-    
-    if cookies:
-        lines = ["🍪 *Your Cookies*\n"]
-        for c in cookies:
-            emoji = "📸" if c['platform'] == 'instagram' else "📘"
-            status = "⚠️ Expired" if c.get('is_expired') else "✅ Active"
-            lines.append(f"{emoji} {c['platform'].title()}: {status}")
-            lines.append(f"   📅 {c.get('expiry_str', 'Unknown')}\n")
-        text = "\n".join(lines)
-    else:
-        text = (
-            "🍪 *Cookie Manager*\n\n"
-            "No cookies saved yet!\n\n"
-            "Cookies let you download content that requires login\n"
-            "(like Instagram stories or Facebook reels)."
+        breakdown = "No downloads yet!"
+        
+    text = (
+        f"📊 <b>Your Statistics</b>\n\n"
+        f"📥 <b>Total Downloads:</b> {total}\n\n"
+        f"<b>Platform Breakdown:</b>\n{breakdown}"
+    )
+    await query.edit_message_text(text, parse_mode=ParseMode.HTML, reply_markup=STATS_KEYBOARD)
+
+
+async def _cb_purge_execute(query, context: ContextTypes.DEFAULT_TYPE, user_id: str) -> None:
+    await query.edit_message_text("🧹 Starting full system purge...")
+    
+    # Trigger same logic as /purge command
+    if context.job_queue:
+        context.job_queue.run_once(
+            cleanup_job, 
+            when=0,
+            data={'force': True, 'chat_id': query.message.chat_id},
+            name=f"purge_{user_id}"
         )
+    else:
+        await query.message.reply_text("⚠️ System Error: Job Queue not active. Cannot schedule purge.")
+        _log.error("JobQueue not available to schedule purge")
+
+
+def _user_state_lock(context: ContextTypes.DEFAULT_TYPE) -> asyncio.Lock:
+    """
+    Lock for one user's conversation state and cookie files.
     
-    keyboard = InlineKeyboardMarkup([
-        [InlineKeyboardButton("📸 Add Instagram", callback_data="cookies_instagram"),
-         InlineKeyboardButton("📘 Add Facebook", callback_data="cookies_facebook")],
-        [InlineKeyboardButton("🗑️ Delete Cookies", callback_data="menu_delete_cookies")],
-        [InlineKeyboardButton("⬅️ Main Menu", callback_data="menu_main")],
-    ])
+    Updates are handled concurrently, so handlers that read and then change
+    context.user_data or the user's cookies hold this while they do.
+    """
+    return context.user_data.setdefault('state_lock', asyncio.Lock())
+
+
+async def _cb_upload_cookies(query, context: ContextTypes.DEFAULT_TYPE, user_id: str) -> None:
+    """Handle cookies_<platform>: wait for that platform's cookie file."""
+    platform = query.data.split('_', 1)[1]
+    text = COOKIE_UPLOAD_TEXTS.get(platform)
+    if text is None:
+        return
     
-    await target.edit_message_text(text, parse_mode='Markdown', reply_markup=keyboard)
+    async with _user_state_lock(context):
+        context.user_data['awaiting_cookies'] = platform
+    await query.edit_message_text(text, parse_mode=ParseMode.HTML, reply_markup=COOKIE_UPLOAD_KEYBOARD)
+
+
+async def _cb_delete_cookies(query, context: ContextTypes.DEFAULT_TYPE, user_id: str) -> None:
+    """Handle delete_<platform> and delete_all."""
+    target = query.data.split('_', 1)[1]
+    
+    # Don't delete underneath a cookie upload that's still being saved
+    async with _user_state_lock(context):
+        if target == "all":
+            ig = cookie_manager.delete_cookie_file(user_id, "instagram")
+            fb = cookie_manager.delete_cookie_file(user_id, "facebook")
+            text = "✅ All cookies deleted!" if (ig or fb) else "🤷 No cookies to delete."
+        elif target in COOKIE_UPLOAD_TEXTS:
+            deleted = cookie_manager.delete_cookie_file(user_id, target)
+            name = target.title()
+            text = f"✅ {name} cookies deleted!" if deleted else f"🤷 No {name} cookies found."
+        else:
+            return
+        
+        COOKIE_LIST_CACHE.pop(user_id, None)
+    await query.edit_message_text(text, reply_markup=BACK_TO_COOKIES_KEYBOARD)
 
 
+# Exact callback_data -> handler(query, context, user_id)
+CALLBACK_HANDLERS = {
+    "menu_main": _cb_menu_main,
+    "menu_help": _cb_menu_help,
+    "menu_cookies": _cb_menu_cookies,
+    "menu_stats": _cb_menu_stats,
+    "menu_purge_execute": _cb_purge_execute,
+    # Legacy support
+    "help": _cb_menu_help,
+    "upload_cookies": _cb_menu_cookies,
+}
+
+# Second tier for parameterised callbacks, keyed on the part before the first '_'
+CALLBACK_PREFIX_HANDLERS = {
+    "cookies": _cb_upload_cookies,
+    "delete": _cb_delete_cookies,
+}
+
 
 async def button_callback(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Handle all inline keyboard button callbacks."""
     query = update.callback_query
     await query.answer()
     user_id = str(update.effective_user.id)
+    data = query.data
     
-    # ============= MAIN NAVIGATION =============
-    
-    if query.data == "menu_main":
-        await send_main_menu(query, is_new_message=False)
-    
-    elif query.data == "menu_help":
-        await send_help_menu(query, is_new_message=False)
-    
-    elif query.data == "menu_cookies":
-        await send_cookies_menu(query, user_id)
+    page = STATIC_PAGES.get(data)
+    if page:
+        text, keyboard = page
+        await query.edit_message_text(text, parse_mode=ParseMode.HTML, reply_markup=keyboard)
+        return
     
-    elif query.data == "menu_stats":
-        stats = stats_manager.get_user_stats(user_id)
-        total = stats.get('total_downloads', 0)
-        platforms = stats.get('platforms', {})
-        
-        # Build platform breakdown
-        if platforms:
-            breakdown = "\n".join([f"• {p}: {c}" for p, c in platforms.items()])
-        else:
-            breakdown = "No downloads yet!"
-            
-        text = (
-            f"📊 *Your Statistics*\n\n"
-            f"📥 *Total Downloads:* {total}\n\n"
-            f"*Platform Breakdown:*\n{breakdown}"
-        )
-        keyboard = InlineKeyboardMarkup([
-            [InlineKeyboardButton("⬅️ Main Menu", callback_data="menu_main")],
-        ])
-        await query.edit_message_text(text, parse_mode='Markdown', reply_markup=keyboard)
-    
-    # ============= PLATFORM HELP =============
-    
-    elif query.data == "help_snapchat":
-        text = (
-            "👻 *Snapchat Tips*\n\n"
-            "Send me a profile link like:\n"
-            "`snapchat.com/add/username`\n\n"
-            "I'll grab ALL their public stories!\n\n"
-            "💡 _No cookies needed for Snapchat_"
-        )
-        keyboard = InlineKeyboardMarkup([
-            [InlineKeyboardButton("⬅️ Back to Help", callback_data="menu_help")],
-        ])
-        await query.edit_message_text(text, parse_mode='Markdown', reply_markup=keyboard)
-    
-    elif query.data == "help_instagram":
-        text = (
-            "📸 *Instagram Tips*\n\n"
-            "• *Public posts/reels*: Just send the link\n"
-            "• *Stories/Private*: Need cookies first\n\n"
-            "Example links:\n"
-            "`instagram.com/p/ABC123`\n"
-            "`instagram.com/reel/XYZ789`\n\n"
-            "💡 _Use 'Manage Cookies' to add login cookies_"
-        )
-        keyboard = InlineKeyboardMarkup([
-            [InlineKeyboardButton("🍪 Add Instagram Cookies", callback_data="cookies_instagram")],
-            [InlineKeyboardButton("⬅️ Back to Help", callback_data="menu_help")],
-        ])
-        await query.edit_message_text(text, parse_mode='Markdown', reply_markup=keyboard)
-    
-    elif query.data == "help_tiktok":
-        text = (
-            "🎵 *TikTok Tips*\n\n"
-            "Just send a TikTok video link:\n"
-            "`tiktok.com/@user/video/123`\n\n"
-            "I'll download it without watermark!\n\n"
-            "💡 _No cookies needed for most videos_"
-        )
-        keyboard = InlineKeyboardMarkup([
-            [InlineKeyboardButton("⬅️ Back to Help", callback_data="menu_help")],
-        ])
-        await query.edit_message_text(text, parse_mode='Markdown', reply_markup=keyboard)
-    
-    elif query.data == "help_facebook":
-        text = (
-            "📘 *Facebook Tips*\n\n"
-            "• *Public videos*: Just send the link\n"
-            "• *Reels/Private*: Need cookies first\n\n"
-            "Example link:\n"
-            "`facebook.com/watch/?v=123`\n\n"
-            "💡 _Many Facebook videos require login cookies_"
-        )
-        keyboard = InlineKeyboardMarkup([
-            [InlineKeyboardButton("🍪 Add Facebook Cookies", callback_data="cookies_facebook")],
-            [InlineKeyboardButton("⬅️ Back to Help", callback_data="menu_help")],
-        ])
-        await query.edit_message_text(text, parse_mode='Markdown', reply_markup=keyboard)
-
-    elif query.data == "help_twitter":
-        text = (
-            "🐦 *Twitter/X Tips*\n\n"
-            "Send me a tweet link:\n"
-            "`x.com/user/status/123...`\n"
-            "`twitter.com/user/status/123...`\n\n"
-            "I'll download the video or images!\n\n"
-            "💡 _No cookies needed usually_"
-        )
-        keyboard = InlineKeyboardMarkup([
-            [InlineKeyboardButton("⬅️ Back to Help", callback_data="menu_help")],
-        ])
-        await query.edit_message_text(text, parse_mode='Markdown', reply_markup=keyboard)
-
-    # ============= SYSTEM ACTIONS =============
-
-    elif query.data == "menu_purge_confirm":
-        text = (
-            "⚠️ *System Purge - Warning*\n\n"
-            "This will delete ALL downloaded files from the server.\n"
-            "This is useful if storage is full or downloads are stuck.\n\n"
-            "*Are you sure?*"
-        )
-        keyboard = InlineKeyboardMarkup([
-            [InlineKeyboardButton("🗑️ Yes, Purge Everything", callback_data="menu_purge_execute")],
-            [InlineKeyboardButton("⬅️ No, Go Back", callback_data="menu_help")],
-        ])
-        await query.edit_message_text(text, parse_mode='Markdown', reply_markup=keyboard)
-
-    elif query.data == "menu_purge_execute":
-        await query.edit_message_text("🧹 Starting full system purge...")
-        user_id = query.from_user.id
-        
-        # Trigger same logic as /purge command
-        if context.job_queue:
-            context.job_queue.run_once(
-                cleanup_job, 
-                when=0,
-                data={'force': True, 'chat_id': query.message.chat_id},
-                name=f"purge_{user_id}"
-            )
-        else:
-             await query.message.reply_text("⚠️ System Error: Job Queue not active. Cannot schedule purge.")
-             logging.error("JobQueue not available to schedule purge")
-    
-    # ============= COOKIE MANAGEMENT =============
-    
-    elif query.data == "cookies_instagram":
-        context.user_data['awaiting_cookies'] = 'instagram'
-        text = (
-            "📸 *Upload Instagram Cookies*\n\n"
-            "Send me your `cookies.txt` file from Instagram.\n\n"
-            "*How to get it:*\n"
-            "1. Install 'Get cookies.txt' extension\n"
-            "2. Go to instagram.com (logged in)\n"
-            "3. Export cookies\n"
-            "4. Send the file here\n\n"
-            "_Waiting for your file..._"
-        )
-        keyboard = InlineKeyboardMarkup([
-            [InlineKeyboardButton("❌ Cancel", callback_data="menu_cookies")],
-        ])
-        await query.edit_message_text(text, parse_mode='Markdown', reply_markup=keyboard)
-    
-    elif query.data == "cookies_facebook":
-        context.user_data['awaiting_cookies'] = 'facebook'
-        text = (
-            "📘 *Upload Facebook Cookies*\n\n"
-            "Send me your `cookies.txt` file from Facebook.\n\n"
-            "*How to get it:*\n"
-            "1. Install 'Get cookies.txt' extension\n"
-            "2. Go to facebook.com (logged in)\n"
-            "3. Export cookies\n"
-            "4. Send the file here\n\n"
-            "_Waiting for your file..._"
-        )
-        keyboard = InlineKeyboardMarkup([
-            [InlineKeyboardButton("❌ Cancel", callback_data="menu_cookies")],
-        ])
-        await query.edit_message_text(text, parse_mode='Markdown', reply_markup=keyboard)
-    
-    elif query.data == "menu_delete_cookies":
-        text = (
-            "🗑️ *Delete Cookies*\n\n"
-            "Which cookies would you like to delete?"
-        )
-        keyboard = InlineKeyboardMarkup([
-            [InlineKeyboardButton("📸 Instagram", callback_data="delete_instagram"),
-             InlineKeyboardButton("📘 Facebook", callback_data="delete_facebook")],
-            [InlineKeyboardButton("⚠️ Delete All", callback_data="delete_all")],
-            [InlineKeyboardButton("⬅️ Back", callback_data="menu_cookies")],
-        ])
-        await query.edit_message_text(text, parse_mode='Markdown', reply_markup=keyboard)
-    
-    elif query.data == "delete_instagram":
-        deleted = cookie_manager.delete_cookie_file(user_id, "instagram")
-        text = "✅ Instagram cookies deleted!" if deleted else "🤷 No Instagram cookies found."
-        keyboard = InlineKeyboardMarkup([
-            [InlineKeyboardButton("⬅️ Back to Cookies", callback_data="menu_cookies")],
-        ])
-        await query.edit_message_text(text, reply_markup=keyboard)
-    
-    elif query.data == "delete_facebook":
-        deleted = cookie_manager.delete_cookie_file(user_id, "facebook")
-        text = "✅ Facebook cookies deleted!" if deleted else "🤷 No Facebook cookies found."
-        keyboard = InlineKeyboardMarkup([
-            [InlineKeyboardButton("⬅️ Back to Cookies", callback_data="menu_cookies")],
-        ])
-        await query.edit_message_text(text, reply_markup=keyboard)
-    
-    elif query.data == "delete_all":
-        ig = cookie_manager.delete_cookie_file(user_id, "instagram")
-        fb = cookie_manager.delete_cookie_file(user_id, "facebook")
-        text = "✅ All cookies deleted!" if (ig or fb) else "🤷 No cookies to delete."
-        keyboard = InlineKeyboardMarkup([
-            [InlineKeyboardButton("⬅️ Back to Cookies", callback_data="menu_cookies")],
-        ])
-        await query.edit_message_text(text, reply_markup=keyboard)
-    
-    # ============= LEGACY SUPPORT =============
-    
-    elif query.data == "help":
-        await send_help_menu(query, is_new_message=False)
-    
-    elif query.data == "upload_cookies":
-        await send_cookies_menu(query, user_id)
+    handler = CALLBACK_HANDLERS.get(data) or CALLBACK_PREFIX_HANDLERS.get(data.split('_', 1)[0])
+    if handler:
+        await handler(query, context, user_id)
 
 
 async def handle_url(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
@@ -460,23 +663,50 @@ async def handle_url(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None
         return
     
     # Send processing message with fun text
-    proc_msg = random.choice(PROCESSING_MSGS)
-    status_msg = await update.message.reply_text(f"{proc_msg}")
+    proc_msg = next(_PROC_CYCLE)
+    status_msg = await update.message.reply_text(proc_msg)
+    
+    # Set when the download streams files straight into an upload task
+    upload_task: Optional[asyncio.Task] = None
     
     # Define download function based on platform
     async def download_func():
+        nonlocal upload_task
         try:
             if platform == "Snapchat":
                 # Check if it's a Spotlight link (public video)
                 if "/spotlight/" in url:
-                    logging.info("🔦 Detected Snapchat Spotlight link, using gallery-dl...")
+                    _log.info("🔦 Detected Snapchat Spotlight link, using gallery-dl...")
                     return await gallery_dl.download(url, platform, user_id)
                 
                 # Otherwise treat as User Stories
                 username = extract_snapchat_username(url)
                 if not username:
                     return {'success': False, 'error': 'Invalid Snapchat link'}
-                return snapchat.download_stories(username)
+                # SnapchatDownloader uses blocking requests; keep it off the event loop.
+                # Each story is handed to the uploader as soon as it lands on disk.
+                file_queue: asyncio.Queue = asyncio.Queue()
+                loop = asyncio.get_running_loop()
+                upload_task = asyncio.create_task(
+                    batch_upload_media(update, [], status_msg, file_queue=file_queue)
+                )
+                result = None
+                try:
+                    result = await asyncio.to_thread(
+                        snapchat.download_stories,
+                        username,
+                        on_file=lambda path: loop.call_soon_threadsafe(file_queue.put_nowait, path)
+                    )
+                    return result
+                finally:
+                    file_queue.put_nowait(None)
+                    if not (result and result.get('success') and result.get('files')):
+                        # The queue reports this outcome and never calls
+                        # upload_func, so stop the uploader before it writes
+                        # a second, contradictory final status
+                        upload_task.cancel()
+                        await asyncio.gather(upload_task, return_exceptions=True)
+                        upload_task = None
             else:
                 # Instagram, TikTok, Twitter, Facebook
                 return await gallery_dl.download(url, platform, user_id)
@@ -485,7 +715,10 @@ async def handle_url(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None
 
     # Define upload function
     async def upload_func(files):
-        await batch_upload_media(update, files, status_msg)
+        if upload_task is not None:
+            await upload_task
+        else:
+            await batch_upload_media(update, files, status_msg)
 
     # Submit to queue
     if download_queue:
@@ -504,16 +737,128 @@ async def handle_url(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None
             # Show queue position if queued
             pos = download_queue.get_queue_position(job.job_id)
             if pos > 0:
-                 await status_msg.edit_text(f"⏳ *Queued* (Position: {pos})\nWaiting for available worker...", parse_mode='Markdown')
+                 await edit_status(status_msg, f"⏳ <b>Queued</b> (Position: {pos})\nWaiting for available worker...", parse_mode=ParseMode.HTML)
         else:
-            await status_msg.edit_text("⚠️ *Queue Full*\nYou have too many active downloads. Please wait for one to finish.")
+            await status_msg.edit_text(
+                "⚠️ <b>Queue Full</b>\nYou have too many active downloads. Please wait for one to finish.",
+                parse_mode=ParseMode.HTML
+            )
     else:
         # Fallback if queue failed to init
         await status_msg.edit_text("⚠️ System Error: Queue not active.")
-        logging.error("Download queue not initialized!")
+        _log.error("Download queue not initialized!")
 
 
-async def batch_upload_media(update: Update, files: list, status_msg) -> None:
+def _bulk_unlink(paths: List[str]) -> int:
+    """
+    Delete files in one pass, ignoring ones that are already gone.
+    
+    Returns:
+        Number of files actually removed
+    """
+    removed = 0
+    for filepath in paths:
+        try:
+            os.unlink(filepath)
+            removed += 1
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            _log.warning("Failed to cleanup %s: %s", filepath, e)
+    return removed
+
+
+def _load_media(media_cls, filepath: str, caption: Optional[str] = None):
+    """
+    Build an InputMedia object from a local file.
+    
+    PTB reads the whole file when the object is constructed, so this runs in
+    a worker thread and the handle can be closed straight away. The filename
+    is passed explicitly so PTB doesn't have to guess it from the handle.
+    """
+    with open(filepath, 'rb') as f:
+        return media_cls(media=f, filename=os.path.basename(filepath), caption=caption)
+
+
+def _prestat_files(files: List[str]) -> Dict[str, Tuple[int, str]]:
+    """
+    Collect size and lowercase extension for downloaded files in one pass.
+    
+    Each parent directory is scanned once with os.scandir instead of calling
+    getsize per file. Files that can't be stat'ed are left out of the result.
+    
+    Args:
+        files: Paths returned by a downloader
+        
+    Returns:
+        Dict mapping path -> (size in bytes, lowercase extension)
+    """
+    by_dir: Dict[str, set] = {}
+    for filepath in files:
+        by_dir.setdefault(os.path.dirname(filepath), set()).add(filepath)
+    
+    info: Dict[str, Tuple[int, str]] = {}
+    for directory, wanted in by_dir.items():
+        try:
+            with os.scandir(directory or '.') as it:
+                for entry in it:
+                    path = os.path.join(directory, entry.name)
+                    if path in wanted:
+                        # Extension from the bare name, so dots in directories don't count;
+                        # dot > 0 keeps splitext's "'.hidden' has no extension" rule
+                        name = entry.name
+                        dot = name.rfind('.')
+                        info[path] = (entry.stat().st_size, name[dot:].lower() if dot > 0 else '')
+        except OSError as e:
+            _log.warning("Failed to scan %s: %s", directory, e)
+    
+    return info
+
+
+def _chunked(items: list, size: int) -> Iterator[list]:
+    """Yield successive lists of at most ``size`` items without pre-slicing."""
+    it = iter(items)
+    return iter(lambda: list(itertools.islice(it, size)), [])
+
+
+async def _queue_chunks(file_queue: asyncio.Queue, size: int, seen: list) -> AsyncIterator[list]:
+    """
+    Group paths from a queue into lists of at most ``size`` as they arrive.
+    
+    Args:
+        file_queue: Queue of file paths, terminated by a None sentinel
+        size: Maximum batch length
+        seen: List that every received path is appended to
+    """
+    batch = []
+    while (filepath := await file_queue.get()) is not None:
+        seen.append(filepath)
+        batch.append(filepath)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+class _PreparedBatch(NamedTuple):
+    """A media batch read into memory and ready to send."""
+    batch_idx: int
+    files: list
+    media_group: list
+    valid_files: List[str]
+    large_files: List[Tuple[str, int]]
+    individual_files: List[Tuple[str, str]]
+    nbytes: int
+    failed: int
+
+
+async def batch_upload_media(
+    update: Update,
+    files: list,
+    status_msg,
+    file_queue: Optional[asyncio.Queue] = None
+) -> None:
     """
     Upload media files in batches using Telegram media groups.
     
@@ -521,220 +866,298 @@ async def batch_upload_media(update: Update, files: list, status_msg) -> None:
     - Max 10 files per media group
     - Max 50MB per file for bots
     - Max 10MB for photos
-    """
-    from telegram import InputMediaPhoto, InputMediaVideo
-    from telegram.error import RetryAfter
     
+    Args:
+        update: Update whose chat receives the media
+        files: Files to upload; when streaming, received paths are appended here
+        status_msg: Message edited with progress
+        file_queue: Optional queue to stream paths from while they are still
+            downloading (None-terminated). Batches are sent as soon as they fill.
+    """
+    streaming = file_queue is not None
     total_files = len(files)
+    file_info = {} if streaming else await asyncio.to_thread(_prestat_files, files)
     batch_size = 10  # Telegram max for media groups
-    batches = [files[i:i + batch_size] for i in range(0, len(files), batch_size)]
+    num_batches = (total_files + batch_size - 1) // batch_size
     
-    uploaded_count = 0
-    failed_count = 0
+    last_status_edit = 0.0
+    
+    # Upload memory budget: bytes of media groups loaded but not yet sent
+    inflight_bytes = 0
+    budget = asyncio.Condition()
+    
+    async def _reserve(nbytes: int) -> None:
+        nonlocal inflight_bytes
+        async with budget:
+            # A batch bigger than the whole budget still goes, just on its own
+            await budget.wait_for(
+                lambda: inflight_bytes == 0 or inflight_bytes + nbytes <= MAX_INFLIGHT_UPLOAD_BYTES
+            )
+            inflight_bytes += nbytes
+    
+    async def _release(nbytes: int) -> None:
+        nonlocal inflight_bytes
+        async with budget:
+            inflight_bytes -= nbytes
+            budget.notify_all()
     
-    for batch_idx, batch in enumerate(batches):
+    async def _prepare_batch(batch_idx: int, batch: list) -> _PreparedBatch:
+        """Sort a batch's files by how they're sent and read the media group into memory."""
+        failed = 0
+        
         batch_start = batch_idx * batch_size + 1
-        batch_end = min((batch_idx + 1) * batch_size, total_files)
         
-        # Update status with fun message
-        await status_msg.edit_text(
-            f"🚀 Sending your stories to space... batch {batch_idx + 1}/{len(batches)}\n"
-            f"(files {batch_start}-{batch_end} of {total_files})"
-        )
+        if streaming:
+            file_info.update(await asyncio.to_thread(_prestat_files, batch))
         
-        # Prepare media group
-        media_group = []
-        valid_files = []
+        to_load = []  # (media class, path) pairs read concurrently below
+        large_files = []  # Over the Bot API limit, sent via MTProto
         files_to_send_individually = []  # Files that can't be in media group
         
-        # Supported extensions for media groups
-        photo_exts = ('.jpg', '.jpeg', '.png', '.webp', '.gif')
-        video_exts = ('.mp4', '.mov', '.webm', '.avi', '.mkv', '.m4v')
-        
-        for idx, filepath in enumerate(batch):
+        for filepath in batch:
             try:
-                file_size = os.path.getsize(filepath)
-                file_ext = os.path.splitext(filepath)[1].lower()
+                if filepath not in file_info:
+                    raise FileNotFoundError(filepath)
+                file_size, file_ext = file_info[filepath]
                 
                 # 50MB limit for bot API - try MTProto for larger files
                 if file_size > 50 * 1024 * 1024:
-                    # Try MTProto for large files
-                    if mtproto_client and mtproto_client.is_connected:
-                        logging.info(f"📤 Large file ({file_size / 1024 / 1024:.1f}MB), using MTProto...")
-                        chat_id = update.effective_chat.id
-                        success = await mtproto_client.upload_file(chat_id, filepath, caption="")
-                        if success:
-                            uploaded_count += 1
-                            # Cleanup after successful upload
-                            try:
-                                os.remove(filepath)
-                                logging.debug(f"Cleaned up: {filepath}")
-                            except:
-                                pass
-                        else:
-                            failed_count += 1
-                    else:
-                        logging.warning(f"File too large (>50MB) and MTProto not available: {filepath}")
-                        failed_count += 1
+                    large_files.append((filepath, file_size))
                     continue
                 
-                if file_ext in photo_exts:
-                    # Photos have 10MB limit in media groups
-                    if file_size > 10 * 1024 * 1024:
-                        # Send as document instead
-                        files_to_send_individually.append(('photo', filepath))
-                    else:
-                        media_group.append(InputMediaPhoto(media=open(filepath, 'rb')))
-                        valid_files.append(filepath)
-                        
-                elif file_ext in video_exts:
-                    media_group.append(InputMediaVideo(media=open(filepath, 'rb')))
-                    valid_files.append(filepath)
-                    
-                else:
+                media_cls = EXT_TO_MEDIA.get(file_ext)
+                
+                if media_cls is None:
                     # Send unknown file types as documents individually
                     files_to_send_individually.append(('document', filepath))
                     
+                elif media_cls is InputMediaPhoto and file_size > 10 * 1024 * 1024:
+                    # Photos have 10MB limit in media groups - send as document instead
+                    files_to_send_individually.append(('photo', filepath))
+                    
+                else:
+                    to_load.append((media_cls, filepath))
+                    
             except Exception as e:
-                logging.error(f"Error preparing file {filepath}: {e}")
-                failed_count += 1
+                _log.error("Error preparing file %s: %s", filepath, e)
+                failed += 1
                 continue
         
-        if not media_group and not files_to_send_individually:
-            continue
+        def _caption(count: int) -> str:
+            text = f"📸 Stories {batch_start}-{batch_start + count - 1}"
+            return text if streaming else f"{text} of {total_files}"
         
-        # Add caption to first item in batch (if we have a media group)
-        if media_group:
-            start_num = batch_start
-            end_num = start_num + len(valid_files) - 1
-            caption = f"📸 Stories {start_num}-{end_num} of {total_files}"
+        # PTB holds every InputMedia file in memory until the group is sent
+        nbytes = sum(file_info[filepath][0] for _, filepath in to_load)
+        await _reserve(nbytes)
+        
+        # Read the whole batch in parallel worker threads; gather keeps order.
+        # The first item gets its caption at construction.
+        media_group = []
+        valid_files = []
+        try:
+            caption = _caption(len(to_load)) if to_load else None
+            loaded = await asyncio.gather(
+                *(
+                    asyncio.to_thread(_load_media, media_cls, filepath, caption if i == 0 else None)
+                    for i, (media_cls, filepath) in enumerate(to_load)
+                ),
+                return_exceptions=True
+            )
+        except BaseException:
+            await _release(nbytes)
+            raise
+        for (_, filepath), media in zip(to_load, loaded):
+            if isinstance(media, Exception):
+                _log.error("Error preparing file %s: %s", filepath, media)
+                failed += 1
+            else:
+                media_group.append(media)
+                valid_files.append(filepath)
+        
+        # Some files failed to load: the caption range (or the captioned
+        # first item itself) is wrong, so rebuild the first item
+        if media_group and len(valid_files) != len(to_load):
             media_group[0] = type(media_group[0])(
                 media=media_group[0].media,
-                caption=caption
+                caption=_caption(len(valid_files))
             )
         
-        # Send media group with retry logic for flood control
+        return _PreparedBatch(
+            batch_idx, batch, media_group, valid_files, large_files, files_to_send_individually, nbytes, failed
+        )
+    
+    async def _send_batch(prepared: _PreparedBatch) -> Tuple[int, int]:
+        """Send one prepared batch; returns (uploaded, failed) counts."""
+        nonlocal last_status_edit
+        uploaded = 0
+        failed = prepared.failed
+        batch_idx = prepared.batch_idx
+        
+        batch_start = batch_idx * batch_size + 1
+        batch_end = batch_start + len(prepared.files) - 1
+        
+        # Update status with fun message, throttled so progress edits don't eat
+        # into the upload rate limit. First and last batches always show.
+        now = time.monotonic()
+        is_last = not streaming and batch_idx == num_batches - 1
+        if batch_idx == 0 or is_last or now - last_status_edit >= STATUS_EDIT_INTERVAL:
+            last_status_edit = now
+            # The total isn't known while streaming
+            if streaming:
+                await edit_status(
+                    status_msg,
+                    f"🚀 Sending your stories to space... batch {batch_idx + 1}\n"
+                    f"(files {batch_start}-{batch_end})"
+                )
+            else:
+                await edit_status(
+                    status_msg,
+                    f"🚀 Sending your stories to space... batch {batch_idx + 1}/{num_batches}\n"
+                    f"(files {batch_start}-{batch_end} of {total_files})"
+                )
+        
+        for filepath, file_size in prepared.large_files:
+            # Try MTProto for large files
+            if mtproto_client and mtproto_client.is_connected:
+                _log.info("📤 Large file (%.1fMB), using MTProto...", file_size / 1024 / 1024)
+                chat_id = update.effective_chat.id
+                success = await mtproto_client.upload_file(chat_id, filepath, caption="")
+                if success:
+                    uploaded += 1
+                    # Cleanup after successful upload
+                    await asyncio.to_thread(_bulk_unlink, [filepath])
+                else:
+                    failed += 1
+            else:
+                _log.warning("File too large (>50MB) and MTProto not available: %s", filepath)
+                failed += 1
+        
+        media_group = prepared.media_group
+        valid_files = prepared.valid_files
+        n_valid = len(valid_files)
+        
+        # Send media group (AIORateLimiter handles flood control and RetryAfter retries)
         if media_group:
-            max_retries = 3
-            for retry in range(max_retries):
-                try:
-                    await update.message.reply_media_group(media=media_group)
-                    uploaded_count += len(valid_files)
-                    
-                    # Cleanup: Delete files after successful upload
-                    for filepath in valid_files:
-                        try:
-                            os.remove(filepath)
-                            logging.debug(f"Cleaned up: {filepath}")
-                        except Exception as e:
-                            logging.warning(f"Failed to cleanup {filepath}: {e}")
-                    
-                    await asyncio.sleep(1)  # Rate limit
-                    break
-                    
-                except RetryAfter as e:
-                    wait_time = e.retry_after
-                    logging.warning(f"Flood control: waiting {wait_time}s")
-                    await status_msg.edit_text(
-                        f"⏳ Telegram says slow down! Waiting {wait_time}s...\n"
-                        f"Batch {batch_idx + 1}/{len(batches)}"
-                    )
-                    await asyncio.sleep(wait_time + 1)
-                    
-                except Exception as e:
-                    if 'flood' in str(e).lower() or 'retry' in str(e).lower():
-                        wait_time = 30
-                        logging.warning(f"Possible flood control: waiting {wait_time}s")
-                        await asyncio.sleep(wait_time)
-                    else:
-                        logging.error(f"Error sending media group: {e}")
-                        failed_count += len(valid_files)
-                        break
+            try:
+                await update.message.reply_media_group(media=media_group)
+                uploaded += n_valid
+            
+                # Cleanup: Delete files after successful upload
+                removed = await asyncio.to_thread(_bulk_unlink, valid_files)
+                _log.debug("Cleaned up %s/%s uploaded files", removed, n_valid)
+            
+            except RetryAfter as e:
+                # Only reached once the rate limiter has exhausted its retries
+                _log.warning("Flood control persisted after retries (%ss)", e.retry_after)
+                failed += n_valid
+            
+            except Exception as e:
+                if FLOOD_RE.search(str(e)):
+                    _log.warning("Possible flood control sending media group: %s", e)
+                else:
+                    _log.error("Error sending media group: %s", e)
+                failed += n_valid
         
         # Send files that couldn't be in the media group individually
+        files_to_send_individually = prepared.individual_files
         for file_type, filepath in files_to_send_individually:
             try:
-                with open(filepath, 'rb') as f:
-                    if file_type == 'photo':
-                        await update.message.reply_document(f, caption=f"📷 {os.path.basename(filepath)}")
-                    else:
-                        await update.message.reply_document(f, caption=f"📁 {os.path.basename(filepath)}")
-                    uploaded_count += 1
-                    await asyncio.sleep(1)  # Rate limit
+                filename = os.path.basename(filepath)
+                # Read in a worker thread; PTB would otherwise read the handle on the loop
+                data = await asyncio.to_thread(Path(filepath).read_bytes)
+                if file_type == 'photo':
+                    await update.message.reply_document(data, filename=filename, caption=f"📷 {filename}")
+                else:
+                    await update.message.reply_document(data, filename=filename, caption=f"📁 {filename}")
+                uploaded += 1
             except Exception as e:
-                logging.error(f"Error sending individual file {filepath}: {e}")
-                failed_count += 1
-            finally:
-                # Cleanup individual file
-                if os.path.exists(filepath):
-                    try:
-                        os.remove(filepath)
-                        logging.debug(f"Cleaned up: {filepath}")
-                    except Exception as e:
-                        logging.warning(f"Failed to cleanup {filepath}: {e}")
+                _log.error("Error sending individual file %s: %s", filepath, e)
+                failed += 1
+        
+        # Cleanup individual files (sent or not) in one thread hop
+        if files_to_send_individually:
+            await asyncio.to_thread(_bulk_unlink, [fp for _, fp in files_to_send_individually])
         
-        # Delay between batches to avoid flood control
-        if batch_idx < len(batches) - 1:
-            await asyncio.sleep(1)
+        return uploaded, failed
     
-    # Final Status Update
-    if failed_count == 0:
-        await status_msg.edit_text("✅ Delivery Complete!\nAll files sent successfully.")
-    elif uploaded_count > 0:
-        await status_msg.edit_text(f"✅ Delivery Complete!\nSent {uploaded_count} files.\n(Failed: {failed_count})")
+    # Batches are sliced lazily from one source
+    if streaming:
+        batch_aiter = _queue_chunks(file_queue, batch_size, files)
+        batch_counter = itertools.count()
+        
+        async def _next_batch() -> Optional[Tuple[int, list]]:
+            batch = await anext(batch_aiter, None)
+            return None if batch is None else (next(batch_counter), batch)
     else:
-        await status_msg.edit_text("❌ Failed to send files.")
+        batch_iter = enumerate(_chunked(files, batch_size))
         
-    # Send friendly closing message
+        async def _next_batch() -> Optional[Tuple[int, list]]:
+            return next(batch_iter, None)
+    
+    async def _prepare_next() -> Optional[_PreparedBatch]:
+        """Prepare the next batch; batches that fail to prepare count as failed."""
+        while (item := await _next_batch()) is not None:
+            batch_idx, batch = item
+            try:
+                return await _prepare_batch(batch_idx, batch)
+            except Exception as e:
+                _log.error("Error preparing batch: %s", e)
+                return _PreparedBatch(batch_idx, batch, [], [], [], [], 0, len(batch))
+        return None
+    
+    # Groups go out strictly one at a time so they arrive in order; the next
+    # one is read from disk while the current one uploads
+    uploaded_count = 0
+    failed_count = 0
+    next_batch = asyncio.create_task(_prepare_next())
+    try:
+        while (prepared := await next_batch) is not None:
+            next_batch = asyncio.create_task(_prepare_next())
+            try:
+                batch_uploaded, batch_failed = await _send_batch(prepared)
+            except Exception as e:
+                _log.error("Error sending batch: %s", e)
+                batch_uploaded, batch_failed = 0, len(prepared.files)
+            finally:
+                await _release(prepared.nbytes)
+            uploaded_count += batch_uploaded
+            failed_count += batch_failed
+    finally:
+        next_batch.cancel()
+    
+    if streaming:
+        if not files:
+            # Download produced nothing; the queue reports that outcome itself
+            return
+        total_files = len(files)
+    
+    # Final Status Update
     if failed_count == 0:
-        await update.message.reply_text(
-            f"Enjoy! ✨ Send another link whenever you're ready.",
-            parse_mode='Markdown'
+        await edit_status(
+            status_msg,
+            "✅ Delivery Complete!\nAll files sent successfully.\n\n"
+            "Enjoy! ✨ Send another link whenever you're ready.",
+            immediate=True
         )
-
+    elif uploaded_count > 0:
+        await edit_status(status_msg, f"✅ Delivery Complete!\nSent {uploaded_count} files.\n(Failed: {failed_count})", immediate=True)
+    else:
+        await edit_status(status_msg, "❌ Failed to send files.", immediate=True)
+    
     # RESILIENT CLEANUP: Ensure ALL files in the original list are removed
     # This covers files that might have failed preparation or upload
-    logging.info(f"🧹 Performing post-upload cleanup for {len(files)} files...")
-    cleaned_count = 0
-    for filepath in files:
-        try:
-            if os.path.exists(filepath):
-                os.remove(filepath)
-                cleaned_count += 1
-                logging.debug(f"Cleaned up (resilient): {filepath}")
-        except Exception as e:
-            logging.warning(f"Failed to cleanup {filepath}: {e}")
-            
+    _log.info("🧹 Performing post-upload cleanup for %s files...", total_files)
+    cleaned_count = await asyncio.to_thread(_bulk_unlink, files)
+    
     if cleaned_count > 0:
-        logging.info(f"✨ Cleanup verified: {cleaned_count}/{len(files)} files removed.")
+        _log.info("✨ Cleanup verified: %s/%s files removed.", cleaned_count, total_files)
 
 
 async def upload_cookies(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Handle /upload_cookies command - show cookie menu."""
     user_id = str(update.effective_user.id)
-    cookies = cookie_manager.list_cookies(user_id) if cookie_manager else []
-    
-    if cookies:
-        lines = ["🍪 *Your Cookies*\n"]
-        for c in cookies:
-            emoji = "📸" if c['platform'] == 'instagram' else "📘"
-            status = "⚠️ Expired" if c.get('is_expired') else "✅ Active"
-            lines.append(f"{emoji} {c['platform'].title()}: {status}")
-            lines.append(f"   📅 {c.get('expiry_str', 'Unknown')}\n")
-        text = "\n".join(lines)
-    else:
-        text = (
-            "🍪 *Cookie Manager*\n\n"
-            "No cookies yet! Add some to unlock private content."
-        )
-    
-    keyboard = InlineKeyboardMarkup([
-        [InlineKeyboardButton("📸 Add Instagram", callback_data="cookies_instagram"),
-         InlineKeyboardButton("📘 Add Facebook", callback_data="cookies_facebook")],
-        [InlineKeyboardButton("🗑️ Delete Cookies", callback_data="menu_delete_cookies")],
-        [InlineKeyboardButton("⬅️ Main Menu", callback_data="menu_main")],
-    ])
-    await update.message.reply_text(text, parse_mode='Markdown', reply_markup=keyboard)
+    await send_cookies_menu(update.message, user_id, is_new_message=True)
 
 
 async def list_cookies(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
@@ -744,16 +1167,10 @@ async def list_cookies(update: Update, context: ContextTypes.DEFAULT_TYPE) -> No
 
 async def delete_cookies(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Handle /delete_cookies command."""
-    keyboard = InlineKeyboardMarkup([
-        [InlineKeyboardButton("📸 Instagram", callback_data="delete_instagram"),
-         InlineKeyboardButton("📘 Facebook", callback_data="delete_facebook")],
-        [InlineKeyboardButton("⚠️ Delete All", callback_data="delete_all")],
-        [InlineKeyboardButton("⬅️ Main Menu", callback_data="menu_main")],
-    ])
     await update.message.reply_text(
-        "🗑️ *Delete Cookies*\n\nWhich cookies would you like to delete?",
-        parse_mode='Markdown',
-        reply_markup=keyboard
+        "🗑️ <b>Delete Cookies</b>\n\nWhich cookies would you like to delete?",
+        parse_mode=ParseMode.HTML,
+        reply_markup=DELETE_COOKIES_COMMAND_KEYBOARD
     )
 
 
@@ -763,6 +1180,33 @@ async def delete_cookies(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
 
 async def handle_document(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Handle document (cookie file) upload."""
+    # Albums arrive as one update per file; buffer them and handle the album once
+    media_group_id = update.message.media_group_id
+    if media_group_id:
+        if media_group_id in MEDIA_GROUP_BUFFER:
+            MEDIA_GROUP_BUFFER[media_group_id].append(update)
+            return
+        
+        MEDIA_GROUP_BUFFER[media_group_id] = [update]
+        # concurrent_updates lets the rest of the album arrive while we wait
+        await asyncio.sleep(MEDIA_GROUP_FLUSH_DELAY)
+        album = MEDIA_GROUP_BUFFER.pop(media_group_id, [update])
+        
+        # Prefer a .txt file so a stray photo in the album doesn't win
+        update = next(
+            (u for u in album if (u.message.document.file_name or '').endswith('.txt')),
+            album[0]
+        )
+        if len(album) > 1:
+            _log.info("📎 Album of %s documents received, handling it once", len(album))
+    
+    # Updates run concurrently; one user's cookie state changes go one at a time
+    async with _user_state_lock(context):
+        await _save_uploaded_cookies(update, context)
+
+
+async def _save_uploaded_cookies(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Save an uploaded cookie file for the platform the user picked."""
     document: Document = update.message.document
     user_id = str(update.effective_user.id)
     
@@ -771,33 +1215,34 @@ async def handle_document(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
     if not awaiting_platform:
         await update.message.reply_text(
             "📎 Got a file, but I wasn't expecting one.\n"
-            "Use /upload\\_cookies first if you want to upload cookies.",
-            parse_mode='Markdown'
+            "Use /upload_cookies first if you want to upload cookies.",
+            parse_mode=ParseMode.HTML
         )
         return
     
     # Reset flag
     context.user_data['awaiting_cookies'] = False
     
-    # Handle legacy True value (default to instagram)
-    if awaiting_platform is True:
-        awaiting_platform = 'instagram'
-    
-    if not document.file_name.endswith('.txt'):
+    if not (document.file_name or '').endswith('.txt'):
         await update.message.reply_text("❌ Please send a .txt file (cookies.txt)")
         return
     
     # Download file
-    platform_emoji = "📸" if awaiting_platform == 'instagram' else "📘"
     status_msg = await update.message.reply_text(f"⏳ Processing {awaiting_platform.title()} cookies...")
     
+    # Unique temp path so concurrent uploads can't clobber each other
+    fd, temp_path = tempfile.mkstemp(prefix=f"cookies_{user_id}_", suffix=".txt")
+    os.close(fd)
+    
     try:
         file = await document.get_file()
-        temp_path = f"/tmp/cookies_{user_id}.txt"
         await file.download_to_drive(temp_path)
         
-        # Save cookie file for the selected platform
-        result = cookie_manager.save_cookie_file(user_id, awaiting_platform, temp_path)
+        # Save cookie file for the selected platform (reads and writes files)
+        result = await asyncio.to_thread(
+            cookie_manager.save_cookie_file, user_id, awaiting_platform, temp_path
+        )
+        COOKIE_LIST_CACHE.pop(user_id, None)
         
         if result['success']:
             platform_name = awaiting_platform.title()
@@ -806,31 +1251,152 @@ async def handle_document(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
             
             if is_expired:
                 await status_msg.edit_text(
-                    f"⚠️ *{platform_name} Cookies Saved (But Expired!)*\n\n"
+                    f"⚠️ <b>{platform_name} Cookies Saved (But Expired!)</b>\n\n"
                     f"These cookies expired on {expiry_str}.\n"
                     f"Please export fresh cookies from your browser and upload again.",
-                    parse_mode='Markdown'
+                    parse_mode=ParseMode.HTML
                 )
             else:
                 await status_msg.edit_text(
-                    f"✅ *{platform_name} Cookies Saved!*\n\n"
+                    f"✅ <b>{platform_name} Cookies Saved!</b>\n\n"
                     f"📅 Valid until: {expiry_str}\n\n"
                     f"You can now download {platform_name} content that requires login.",
-                    parse_mode='Markdown'
+                    parse_mode=ParseMode.HTML
                 )
         else:
             await status_msg.edit_text(
                 f"❌ Failed to save cookies: {result.get('error')}\n\n"
                 "Make sure you exported cookies in Netscape format."
             )
-        
-        # Clean up temp file
-        if os.path.exists(temp_path):
-            os.remove(temp_path)
             
     except Exception as e:
-        logging.error(f"Error processing cookie upload: {e}")
+        _log.error("Error processing cookie upload: %s", e)
         await status_msg.edit_text(f"⚠️ Error: {str(e)}")
+    
+    finally:
+        # Clean up temp file
+        await asyncio.to_thread(_bulk_unlink, [temp_path])
+
+
+# unlinkat-style cleanup needs dir_fd support (not on Windows)
+_DIR_FD_SUPPORTED = os.unlink in os.supports_dir_fd
+_DIR_OPEN_FLAGS = os.O_RDONLY | getattr(os, 'O_DIRECTORY', 0)
+
+# Cleanup unlinks run in chunks of this many files, with at most
+# CLEANUP_CONCURRENCY chunks in flight (leaves the default thread pool
+# free for uploads' to_thread calls)
+CLEANUP_CHUNK_SIZE = 64
+CLEANUP_CONCURRENCY = 8
+
+
+def _scan_expired(download_path: str, force: bool, cutoff: float) -> Dict[str, List[Tuple[str, int]]]:
+    """
+    Find files under download_path last modified before ``cutoff``.
+    
+    The tree is walked with os.scandir and each entry's cached stat() result
+    supplies both mtime and size.
+    
+    Args:
+        download_path: Root of the downloads tree
+        force: Select every file regardless of age
+        cutoff: Files modified before this epoch time are selected
+        
+    Returns:
+        Dict mapping directory -> [(file name, size in bytes)]
+    """
+    expired: Dict[str, List[Tuple[str, int]]] = {}
+    stack = [download_path]
+    
+    while stack:
+        directory = stack.pop()
+        try:
+            with os.scandir(directory) as it:
+                for entry in it:
+                    try:
+                        if entry.is_dir(follow_symlinks=False):
+                            stack.append(entry.path)
+                            continue
+                        
+                        file_stat = entry.stat(follow_symlinks=False)
+                        
+                        # Delete if forced OR if older than max_age
+                        if force or file_stat.st_mtime < cutoff:
+                            expired.setdefault(directory, []).append((entry.name, file_stat.st_size))
+                            
+                    except FileNotFoundError:
+                        # Removed by an upload's own cleanup since the scan
+                        pass
+                    except OSError as e:
+                        _log.warning("Failed to check %s: %s", entry.name, e)
+        except OSError as e:
+            _log.warning("Failed to scan %s: %s", directory, e)
+    
+    return expired
+
+
+def _unlink_in_dir(directory: str, entries: List[Tuple[str, int]]) -> Tuple[int, int]:
+    """
+    Unlink files of one directory relative to an open directory fd.
+    
+    The kernel resolves the directory once instead of the full path for
+    every file.
+    
+    Returns:
+        Tuple of (files removed, bytes freed)
+    """
+    count = 0
+    cleaned_size = 0
+    dfd = None
+    try:
+        if _DIR_FD_SUPPORTED:
+            dfd = os.open(directory, _DIR_OPEN_FLAGS)
+        for name, size in entries:
+            try:
+                if dfd is not None:
+                    os.unlink(name, dir_fd=dfd)
+                else:
+                    os.unlink(os.path.join(directory, name))
+                count += 1
+                cleaned_size += size
+            except FileNotFoundError:
+                pass
+            except OSError as e:
+                _log.warning("Failed to delete %s: %s", name, e)
+    except OSError as e:
+        _log.warning("Failed to open %s: %s", directory, e)
+    finally:
+        if dfd is not None:
+            os.close(dfd)
+    
+    return count, cleaned_size
+
+
+async def _sweep_downloads(download_path: str, force: bool, cutoff: float) -> Tuple[int, int]:
+    """
+    Delete files under download_path last modified before ``cutoff``.
+    
+    The scan runs in one worker thread; the unlinks are then spread over
+    several threads in bounded chunks so per-call latency on slow or
+    networked filesystems overlaps instead of adding up.
+    
+    Returns:
+        Tuple of (files removed, bytes freed)
+    """
+    expired = await asyncio.to_thread(_scan_expired, download_path, force, cutoff)
+    sem = asyncio.Semaphore(CLEANUP_CONCURRENCY)
+    
+    async def _unlink_chunk(directory: str, chunk: List[Tuple[str, int]]) -> Tuple[int, int]:
+        async with sem:
+            return await asyncio.to_thread(_unlink_in_dir, directory, chunk)
+    
+    results = await asyncio.gather(*(
+        _unlink_chunk(directory, chunk)
+        for directory, entries in expired.items()
+        for chunk in _chunked(entries, CLEANUP_CHUNK_SIZE)
+    ))
+    count = sum(r[0] for r in results)
+    _log.debug("Deleted %s %s files", count, 'forced' if force else 'old')
+    return count, sum(r[1] for r in results)
 
 
 async def cleanup_job(context: ContextTypes.DEFAULT_TYPE) -> None:
@@ -845,53 +1411,32 @@ async def cleanup_job(context: ContextTypes.DEFAULT_TYPE) -> None:
         force = context.job.data.get('force', False)
     
     if not download_path:
-        logging.warning("🧹 Cleanup job skipped: download_path not set")
+        _log.warning("🧹 Cleanup job skipped: download_path not set")
         return
         
-    logging.info(f"🧹 Starting {'FORCED ' if force else ''}cleanup...")
-    count = 0
-    cleaned_size = 0
+    _log.info("🧹 Starting %scleanup...", 'FORCED ' if force else '')
     
     try:
-        current_time = time.time()
         max_age = 86400  # 24 hours in seconds
+        # Scanning and unlinking run in worker threads, off the event loop
+        count, cleaned_size = await _sweep_downloads(download_path, force, time.time() - max_age)
         
-        for root, dirs, files in os.walk(download_path):
-            for filename in files:
-                filepath = os.path.join(root, filename)
-                
-                # Check file age
-                try:
-                    file_stat = os.stat(filepath)
-                    file_age = current_time - file_stat.st_mtime
-                    
-                    # Delete if forced OR if older than max_age
-                    if force or file_age > max_age:
-                        file_size = file_stat.st_size
-                        os.remove(filepath)
-                        count += 1
-                        cleaned_size += file_size
-                        logging.debug(f"Deleted {'forced' if force else 'old'} file: {filename}")
-                        
-                except Exception as e:
-                    logging.warning(f"Failed to check/delete {filename}: {e}")
-                    
         if count > 0:
             size_mb = cleaned_size / (1024 * 1024)
             msg = f"✨ Cleanup complete: Removed {count} files ({size_mb:.2f} MB)"
-            logging.info(msg)
+            _log.info(msg)
             # If triggered manually, try to reply
             # If triggered manually, try to reply
             if context.job and context.job.data and context.job.data.get('chat_id'):
                 await context.bot.send_message(chat_id=context.job.data['chat_id'], text=msg)
         else:
             msg = "✨ Cleanup complete: No files found to remove"
-            logging.info(msg)
+            _log.info(msg)
             if context.job and context.job.data and context.job.data.get('chat_id'):
                 await context.bot.send_message(chat_id=context.job.data['chat_id'], text=msg)
             
     except Exception as e:
-        logging.error(f"❌ Cleanup job failed: {e}")
+        _log.error("❌ Cleanup job failed: %s", e)
         if context.job and context.job.data and context.job.data.get('chat_id'):
             await context.bot.send_message(chat_id=context.job.data['chat_id'], text=f"❌ Cleanup failed: {e}")
 
@@ -918,13 +1463,16 @@ async def purge_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> N
         # but cleanup_job relies on context.job structure. 
         # Better to warn user.
         await update.message.reply_text("⚠️ System Error: Job Queue not active. Cannot schedule purge.")
-        logging.error("JobQueue not available to schedule purge")
+        _log.error("JobQueue not available to schedule purge")
 
 
 def run_telegram_bot(token: str, download_path: str, cookie_path: str, api_base_url: str) -> None:
     """Run the Telegram bot."""
     global snapchat, gallery_dl, cookie_manager, mtproto_client
     
+    from downloaders.snapchat import SnapchatDownloader
+    from downloaders.gallery_dl import GalleryDLDownloader, GDL_STALL_TIMEOUT
+    
     # Initialize components
     snapchat = SnapchatDownloader(
         api_base_url=api_base_url,
@@ -933,13 +1481,37 @@ def run_telegram_bot(token: str, download_path: str, cookie_path: str, api_base_
     
     gallery_dl = GalleryDLDownloader(
         output_path=download_path,
-        cookie_path=cookie_path
+        cookie_path=cookie_path,
+        in_process=os.getenv('GALLERY_DL_IN_PROCESS', '').lower() in ('1', 'true', 'yes'),
+        stall_timeout=float(os.getenv('GDL_STALL_TIMEOUT', GDL_STALL_TIMEOUT))
     )
     
     cookie_manager = CookieManager(cookie_path=cookie_path)
     
-    # Create application with increased timeouts for slow connections
-    app = Application.builder().token(token).read_timeout(120).write_timeout(120).build()
+    # Must happen before run_polling creates the event loop
+    if UVLOOP_AVAILABLE:
+        asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
+        _log.info("⚡ Using uvloop event loop")
+    
+    # Create application with increased timeouts for slow connections.
+    # Media uploads get a longer write timeout; up to MAX_CONCURRENT_UPDATES
+    # updates are handled at once so one user's upload doesn't block everyone
+    # else's commands (stateful handlers take _user_state_lock), and the
+    # connection pool is sized so concurrent jobs' requests don't queue on it.
+    # AIORateLimiter enforces Telegram's per-chat limits and retries RetryAfter.
+    app = (
+        Application.builder()
+        .token(token)
+        .connection_pool_size(32)
+        .read_timeout(120)
+        .write_timeout(120)
+        .media_write_timeout(300)
+        .pool_timeout(60)
+        .get_updates_connection_pool_size(2)
+        .concurrent_updates(MAX_CONCURRENT_UPDATES)
+        .rate_limiter(AIORateLimiter(max_retries=3))
+        .build()
+    )
     
     # Initialize MTProto client and Download Queue
     if MTPROTO_AVAILABLE and init_mtproto:
@@ -949,12 +1521,12 @@ def run_telegram_bot(token: str, download_path: str, cookie_path: str, api_base_
             # Start MTProto
             mtproto_client = await init_mtproto()
             if mtproto_client and mtproto_client.is_connected:
-                logging.info("📤 MTProto ready for large file uploads (up to 2GB)")
+                _log.info("📤 MTProto ready for large file uploads (up to 2GB)")
             else:
-                logging.info("ℹ️ MTProto not configured - files >50MB will be skipped")
+                _log.info("ℹ️ MTProto not configured - files >50MB will be skipped")
             
             # Start Download Queue
-            logging.info("🚀 Starting download queue workers...")
+            _log.info("🚀 Starting download queue workers...")
             download_queue = await init_queue(max_concurrent=3, status_callback=queue_status_callback)
         
         app.post_init = post_init
@@ -962,9 +1534,9 @@ def run_telegram_bot(token: str, download_path: str, cookie_path: str, api_base_
         # Just init queue if MTProto failed
         async def post_init(application):
             global download_queue
-            logging.info("🚀 Starting download queue workers...")
+            _log.info("🚀 Starting download queue workers...")
             download_queue = await init_queue(max_concurrent=3, status_callback=queue_status_callback)
-            logging.info("ℹ️ MTProto not available - files >50MB will be skipped")
+            _log.info("ℹ️ MTProto not available - files >50MB will be skipped")
             
         app.post_init = post_init
     
@@ -974,9 +1546,9 @@ def run_telegram_bot(token: str, download_path: str, cookie_path: str, api_base_
     # Schedule cleanup job (every 24h)
     if app.job_queue:
         app.job_queue.run_repeating(cleanup_job, interval=86400, first=10)
-        logging.info("🧹 Cleanup job scheduled (every 24h)")
+        _log.info("🧹 Cleanup job scheduled (every 24h)")
     else:
-        logging.warning("⚠️ JobQueue not available - cleanup job disabled")
+        _log.warning("⚠️ JobQueue not available - cleanup job disabled")
     
     # Add handlers
     app.add_handler(CommandHandler("start", start))
@@ -994,7 +1566,7 @@ def run_telegram_bot(token: str, download_path: str, cookie_path: str, api_base_
     
     # URL handler (text messages that look like URLs)
     app.add_handler(MessageHandler(
-        filters.TEXT & ~filters.COMMAND & filters.Regex(r'^https?://'),
+        filters.TEXT & ~filters.COMMAND & URL_FILTER,
         handle_url
     ))
     
@@ -1002,7 +1574,7 @@ def run_telegram_bot(token: str, download_path: str, cookie_path: str, api_base_
     app.add_handler(MessageHandler(filters.Document.ALL, handle_document))
     
     # Run bot
-    logging.info("🤖 StoryFlow Telegram Bot starting...")
+    _log.info("🤖 StoryFlow Telegram Bot starting...")
     print("🤖 StoryFlow Telegram Bot started!")
     print("Press Ctrl+C to stop")
     
@@ -1,6 +1,6 @@
 # Core module for StoryFlow
 from .platform import identify_platform, extract_snapchat_username
-from .rate_limiter import RateLimiter
+from .rate_limiter import RateLimiter, AsyncRateLimiter, TokenBucket
 from .retry import create_retry_decorator
 from .queue import DownloadQueue, DownloadJob, JobStatus, get_queue, init_queue
 
@@ -8,6 +8,8 @@ __all__ = [
     'identify_platform',
     'extract_snapchat_username',
     'RateLimiter',
+    'AsyncRateLimiter',
+    'TokenBucket',
     'create_retry_decorator',
     'DownloadQueue',
     'DownloadJob',
@@ -2,14 +2,50 @@
 
 import re
 import logging
-from urllib.parse import urlparse
+from functools import lru_cache
+from urllib.parse import urlparse, urlsplit
 from typing import Tuple, Optional
 
 
+# Supported registered domains (hostname's last two labels) -> platform
+_DOMAIN_PLATFORMS = {
+    'snapchat.com': "Snapchat",
+    'instagram.com': "Instagram",
+    'tiktok.com': "TikTok",
+    'twitter.com': "Twitter",
+    'x.com': "Twitter",
+    'facebook.com': "Facebook",
+    'fb.watch': "Facebook",
+}
+
+
+_HOST_END_RE = re.compile(r'[/?#]')
+
+
+def _fast_host(url: str) -> Optional[str]:
+    """
+    Slice the hostname out of a plain http(s) URL without a full parse.
+    
+    Returns None for anything unusual (other schemes, credentials, ports,
+    IPv6 literals, empty host) so the caller can fall back to urlsplit.
+    """
+    if not url.startswith(('https://', 'http://')):
+        return None
+    start = url.index('://') + 3
+    match = _HOST_END_RE.search(url, start)
+    host = url[start:match.start() if match else len(url)]
+    if not host or '@' in host or ':' in host or '[' in host:
+        return None
+    return host.lower()
+
+
+@lru_cache(maxsize=1024)
 def identify_platform(url: str) -> str:
     """
     Identify platform from URL using robust hostname parsing.
     
+    Results are memoized per URL since the same link is often sent repeatedly.
+    
     Returns:
         - "Snapchat": For snapchat.com URLs
         - "Instagram": For instagram.com URLs
@@ -20,28 +56,19 @@ def identify_platform(url: str) -> str:
         - "Error": For invalid URLs
     """
     try:
-        parsed = urlparse(url)
-        hostname = parsed.netloc.lower()
-        
-        if not hostname:
-            return "Error"
+        hostname = _fast_host(url)
+        if hostname is None:
+            # urlsplit skips the params split urlparse does; hostname drops
+            # any port/credentials and is already lowercased
+            parsed = urlsplit(url)
+            if not parsed.netloc:
+                return "Error"
+            hostname = parsed.hostname or ''
         
-        # Remove www. prefix if present
-        hostname = hostname.replace('www.', '')
-        
-        # Platform matching
-        if 'snapchat.com' in hostname:
-            return "Snapchat"
-        elif 'instagram.com' in hostname:
-            return "Instagram"
-        elif 'tiktok.com' in hostname or 'vm.tiktok.com' in hostname:
-            return "TikTok"
-        elif 'twitter.com' in hostname or 'x.com' in hostname:
-            return "Twitter"
-        elif 'facebook.com' in hostname or 'fb.watch' in hostname:
-            return "Facebook"
-        else:
-            return "Unknown"
+        # Compare whole labels so lookalikes such as notx.com or
+        # instagram.com.evil.tld don't match; www./vm./m. prefixes fall away
+        domain = '.'.join(hostname.rstrip('.').rsplit('.', 2)[-2:])
+        return _DOMAIN_PLATFORMS.get(domain, "Unknown")
             
     except Exception as e:
         logging.error(f"URL parsing error: {e}")
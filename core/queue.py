@@ -2,11 +2,10 @@
 
 import asyncio
 import logging
+import time
 from dataclasses import dataclass, field
 from typing import Dict, Optional, Callable, Any
 from enum import Enum
-from datetime import datetime
-import uuid
 
 
 class JobStatus(Enum):
@@ -17,7 +16,11 @@ class JobStatus(Enum):
     FAILED = "failed"
 
 
-@dataclass
+# States a job never leaves
+TERMINAL_STATUSES = (JobStatus.COMPLETED, JobStatus.FAILED)
+
+
+@dataclass(slots=True)
 class DownloadJob:
     """Represents a download job in the queue."""
     job_id: str
@@ -29,11 +32,19 @@ class DownloadJob:
     message: str = ""
     files: list = field(default_factory=list)
     error: Optional[str] = None
-    created_at: datetime = field(default_factory=datetime.now)
-    completed_at: Optional[datetime] = None
+    # Epoch seconds, for display only; queue order comes from seq
+    created_at: float = field(default_factory=time.time)
+    completed_at: Optional[float] = None
+    seq: int = 0  # FIFO ticket assigned by DownloadQueue.submit
+    # Serialized form, kept once the job is finished and can no longer change
+    _cached_dict: Optional[Dict] = field(default=None, init=False, repr=False, compare=False)
     
     def to_dict(self) -> Dict:
-        return {
+        """Serialize the job (finished jobs return one shared, cached dict)."""
+        if self._cached_dict is not None:
+            return self._cached_dict
+        
+        data = {
             "job_id": self.job_id,
             "user_id": self.user_id,
             "url": self.url,
@@ -44,6 +55,9 @@ class DownloadJob:
             "files_count": len(self.files),
             "error": self.error,
         }
+        if self.status in TERMINAL_STATUSES:
+            self._cached_dict = data
+        return data
 
 
 class DownloadQueue:
@@ -55,21 +69,28 @@ class DownloadQueue:
     - Per-user job limits
     - Concurrent download workers
     - Status callbacks for UI updates
+    - Bounded job history (oldest finished jobs are forgotten)
     """
     
     def __init__(
         self,
         max_concurrent: int = 3,
         max_per_user: int = 2,
-        status_callback: Optional[Callable] = None
+        status_callback: Optional[Callable] = None,
+        max_jobs: int = 1000
     ):
         self.max_concurrent = max_concurrent
         self.max_per_user = max_per_user
         self.status_callback = status_callback
+        self.max_jobs = max_jobs
         
         self._queue: asyncio.Queue = asyncio.Queue()
-        self._jobs: Dict[str, DownloadJob] = {}
+        self._jobs: Dict[str, DownloadJob] = {}  # insertion-ordered, oldest first
         self._user_jobs: Dict[str, list] = {}  # user_id -> [job_ids]
+        self._user_active: Dict[str, int] = {}  # user_id -> unfinished job count
+        # FIFO ticket counters for O(1) queue positions
+        self._seq = 0  # last ticket handed out
+        self._dequeued = 0  # tickets taken by workers so far
         self._workers: list = []
         self._running = False
         
@@ -89,7 +110,7 @@ class DownloadQueue:
         """Stop all workers gracefully."""
         self._running = False
         
-        # Cancel all workers
+        # Cancel all workers (interrupts idle ones blocked in queue.get())
         for worker in self._workers:
             worker.cancel()
         
@@ -121,25 +142,26 @@ class DownloadQueue:
             DownloadJob if queued, None if user limit reached
         """
         # Check user limit
-        user_jobs = self._user_jobs.get(user_id, [])
-        active_jobs = [j for j in user_jobs if self._jobs.get(j) and 
-                       self._jobs[j].status not in (JobStatus.COMPLETED, JobStatus.FAILED)]
-        
-        if len(active_jobs) >= self.max_per_user:
+        active = self._user_active.get(user_id, 0)
+        if active >= self.max_per_user:
             return None
         
-        # Create job
-        job_id = str(uuid.uuid4())[:8]
+        # Create job; the FIFO ticket doubles as a short, unique job ID
+        self._seq += 1
+        job_id = f"{self._seq:08x}"
         job = DownloadJob(
             job_id=job_id,
             user_id=user_id,
             url=url,
             platform=platform,
-            message="Waiting in queue..."
+            message="Waiting in queue...",
+            seq=self._seq
         )
         
         # Track job
+        self._user_active[user_id] = active + 1
         self._jobs[job_id] = job
+        self._reap_jobs()
         if user_id not in self._user_jobs:
             self._user_jobs[user_id] = []
         self._user_jobs[user_id].append(job_id)
@@ -150,6 +172,36 @@ class DownloadQueue:
         logging.info(f"📋 Job {job_id} queued for user {user_id} ({platform})")
         return job
     
+    def _reap_jobs(self):
+        """Forget the oldest finished jobs once more than max_jobs are tracked."""
+        excess = len(self._jobs) - self.max_jobs
+        if excess <= 0:
+            return
+        
+        # Dicts keep insertion order, so this walks from the oldest job
+        stale = []
+        for job in self._jobs.values():
+            if job.status in TERMINAL_STATUSES:
+                stale.append(job)
+                if len(stale) == excess:
+                    break
+        
+        for job in stale:
+            del self._jobs[job.job_id]
+            user_jobs = self._user_jobs.get(job.user_id)
+            if user_jobs:
+                user_jobs.remove(job.job_id)
+                if not user_jobs:
+                    del self._user_jobs[job.user_id]
+    
+    def _release_user_slot(self, user_id: str):
+        """Count one of the user's jobs as finished."""
+        active = self._user_active.get(user_id, 0) - 1
+        if active > 0:
+            self._user_active[user_id] = active
+        else:
+            self._user_active.pop(user_id, None)
+    
     def get_job(self, job_id: str) -> Optional[DownloadJob]:
         """Get job by ID."""
         return self._jobs.get(job_id)
@@ -161,32 +213,23 @@ class DownloadQueue:
     
     def get_queue_position(self, job_id: str) -> int:
         """Get position in queue (1-indexed, 0 if not in queue)."""
-        # This is approximate since we can't peek into asyncio.Queue
+        # The queue is FIFO, so everything ticketed before this job and not
+        # yet taken by a worker is ahead of it
         job = self._jobs.get(job_id)
         if not job or job.status != JobStatus.QUEUED:
             return 0
-        
-        # Count queued jobs before this one
-        pos = 1
-        for jid, j in self._jobs.items():
-            if j.status == JobStatus.QUEUED and j.created_at < job.created_at:
-                pos += 1
-        return pos
+        return max(0, job.seq - self._dequeued)
     
     async def _worker(self, worker_id: int):
         """Worker that processes jobs from the queue."""
         logging.debug(f"Worker {worker_id} started")
         
-        while self._running:
+        while True:
             try:
-                # Get next job (with timeout to check _running flag)
-                try:
-                    job, download_func, upload_func = await asyncio.wait_for(
-                        self._queue.get(),
-                        timeout=1.0
-                    )
-                except asyncio.TimeoutError:
-                    continue
+                # Sleep until a job arrives; stop() cancels this wait directly
+                job, download_func, upload_func = await self._queue.get()
+                
+                self._dequeued += 1
                 
                 logging.info(f"⚙️ Worker {worker_id} processing job {job.job_id}")
                 
@@ -224,7 +267,7 @@ class DownloadQueue:
                     
                     # Mark complete
                     job.status = JobStatus.COMPLETED
-                    job.completed_at = datetime.now()
+                    job.completed_at = time.time()
                     job.message = f"Delivered {len(job.files)} files"
                     await self._notify_status(job)
                     
@@ -236,6 +279,8 @@ class DownloadQueue:
                     await self._notify_status(job)
                 
                 finally:
+                    if job.status in TERMINAL_STATUSES:
+                        self._release_user_slot(job.user_id)
                     self._queue.task_done()
                     
             except asyncio.CancelledError:
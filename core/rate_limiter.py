@@ -1,8 +1,9 @@
 """Token bucket rate limiter for API requests."""
 
 import time
+import array
+import asyncio
 import logging
-from collections import deque
 from threading import Lock
 
 
@@ -19,34 +20,123 @@ class RateLimiter:
         """
         self.max_requests = max_requests
         self.time_window = time_window
-        self.requests = deque()
+        self._window_ns = int(time_window * 1_000_000_000)
+        # Ring buffer of the last max_requests start times (monotonic ns);
+        # _head is the oldest once the buffer is full
+        self._buf = array.array('q', [0] * max_requests)
+        self._head = 0
+        self._count = 0
         self.lock = Lock()
     
-    def wait_if_needed(self) -> None:
-        """Block if rate limit would be exceeded."""
+    def _reserve_slot(self) -> float:
+        """
+        Record the next request and return how long the caller must wait.
+        
+        Takes the earliest free slot: once the buffer is full, that's when the
+        request max_requests places back (the oldest entry) leaves the window.
+        Recording the reservation straight away lets later callers queue
+        behind it.
+        """
         with self.lock:
-            now = time.time()
+            now = time.monotonic_ns()
             
-            # Remove requests outside time window
-            while self.requests and self.requests[0] < now - self.time_window:
-                self.requests.popleft()
-            
-            # Check if we need to wait
-            if len(self.requests) >= self.max_requests:
-                sleep_time = self.time_window - (now - self.requests[0])
-                if sleep_time > 0:
-                    logging.info(f"⏳ Rate limit reached. Waiting {sleep_time:.1f}s...")
-                    time.sleep(sleep_time)
-                    self.requests.popleft()
-            
-            # Record this request
-            self.requests.append(time.time())
+            if self._count < self.max_requests:
+                start = now
+                self._buf[self._count] = start
+                self._count += 1
+            else:
+                start = max(now, self._buf[self._head] + self._window_ns)
+                self._buf[self._head] = start
+                self._head = (self._head + 1) % self.max_requests
+        return (start - now) / 1_000_000_000
+    
+    def wait_if_needed(self) -> None:
+        """Block if rate limit would be exceeded."""
+        # Sleep outside the lock so other callers can take their own slots
+        sleep_time = self._reserve_slot()
+        if sleep_time > 0:
+            logging.info(f"⏳ Rate limit reached. Waiting {sleep_time:.1f}s...")
+            time.sleep(sleep_time)
     
     def get_remaining(self) -> int:
         """Get remaining requests in current window."""
         with self.lock:
-            now = time.time()
-            # Remove expired entries
-            while self.requests and self.requests[0] < now - self.time_window:
-                self.requests.popleft()
-            return max(0, self.max_requests - len(self.requests))
+            cutoff = time.monotonic_ns() - self._window_ns
+            in_window = sum(1 for i in range(self._count) if self._buf[i] >= cutoff)
+            return max(0, self.max_requests - in_window)
+
+
+class AsyncRateLimiter(RateLimiter):
+    """RateLimiter for coroutines: waits with asyncio.sleep instead of blocking."""
+    
+    async def wait_if_needed(self) -> None:
+        """Wait (without blocking the event loop) if rate limit would be exceeded."""
+        # The reservation never sleeps under the lock, so taking it is instant
+        sleep_time = self._reserve_slot()
+        if sleep_time > 0:
+            logging.info(f"⏳ Rate limit reached. Waiting {sleep_time:.1f}s...")
+            await asyncio.sleep(sleep_time)
+
+
+class TokenBucket:
+    """
+    Token bucket: refills continuously at `rate` tokens/s up to `capacity`.
+    
+    Unlike RateLimiter's sliding window, a quiet spell earns back burst
+    capacity gradually, and sustained traffic is spread evenly at `rate`
+    instead of arriving in window-sized clumps.
+    """
+    
+    def __init__(self, rate: float, capacity: float):
+        """
+        Initialize token bucket.
+        
+        Args:
+            rate: Tokens added per second
+            capacity: Maximum tokens held (largest burst); starts full
+        """
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = float(capacity)
+        self._last_refill = time.monotonic()
+        self.lock = Lock()
+    
+    def _reserve(self, tokens: float) -> float:
+        """
+        Take `tokens` and return how long the caller must wait for them.
+        
+        The balance may go negative: that debt is the queue of callers
+        already waiting, so later callers wait behind them.
+        """
+        with self.lock:
+            now = time.monotonic()
+            self._tokens = min(self.capacity, self._tokens + (now - self._last_refill) * self.rate)
+            self._last_refill = now
+            self._tokens -= tokens
+            return max(0.0, -self._tokens / self.rate)
+    
+    def acquire(self, tokens: float = 1) -> None:
+        """Block until `tokens` are available, then consume them."""
+        sleep_time = self._reserve(tokens)
+        if sleep_time > 0:
+            logging.info(f"⏳ Rate limit reached. Waiting {sleep_time:.1f}s...")
+            time.sleep(sleep_time)
+    
+    def defer(self, seconds: float) -> None:
+        """
+        Hold back the next acquire() for at least `seconds`.
+        
+        For when the server says to back off (e.g. a 429 Retry-After): the
+        bucket is put into enough debt that the next token is `seconds` away.
+        """
+        with self.lock:
+            now = time.monotonic()
+            self._tokens = min(self.capacity, self._tokens + (now - self._last_refill) * self.rate)
+            self._last_refill = now
+            self._tokens = min(self._tokens, 1 - seconds * self.rate)
+    
+    def get_remaining(self) -> int:
+        """Get whole tokens currently available."""
+        with self.lock:
+            tokens = min(self.capacity, self._tokens + (time.monotonic() - self._last_refill) * self.rate)
+            return max(0, int(tokens))
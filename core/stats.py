@@ -1,64 +1,101 @@
-"""Simple JSON-based statistics manager."""
+"""SQLite-backed statistics manager."""
 
 import os
 import json
+import sqlite3
 import logging
+import threading
 from typing import Dict, Any
 
+# orjson (optional - faster parsing of large legacy stats files)
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+STATS_DB = "data/stats.db"
+
+# Legacy JSON stats, imported once when the database is first created
 STATS_FILE = "data/stats.json"
 
 class StatsManager:
-    """Manages user statistics."""
+    """
+    Manages user statistics.
+    
+    Safe to call from the event loop and worker threads alike: the shared
+    connection is only used under a lock, and each increment is a single
+    atomic UPSERT, so concurrent increments are never lost.
+    """
     
     def __init__(self):
-        os.makedirs(os.path.dirname(STATS_FILE), exist_ok=True)
-        self._stats = self._load_stats()
+        os.makedirs(os.path.dirname(STATS_DB), exist_ok=True)
+        is_new = not os.path.exists(STATS_DB)
         
-    def _load_stats(self) -> Dict[str, Any]:
-        """Load stats from JSON file."""
-        if not os.path.exists(STATS_FILE):
-            return {}
+        # Autocommit; each increment is a single UPSERT appended to the WAL
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(STATS_DB, isolation_level=None, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS stats ("
+            " user_id TEXT NOT NULL,"
+            " platform TEXT NOT NULL,"
+            " count INTEGER NOT NULL DEFAULT 0,"
+            " PRIMARY KEY (user_id, platform))"
+        )
+        
+        if is_new:
+            self._import_json_stats()
+    
+    def _import_json_stats(self):
+        """Copy counts from the old stats.json into a freshly created database."""
         try:
-            with open(STATS_FILE, 'r') as f:
-                return json.load(f)
+            with open(STATS_FILE, 'rb') as f:
+                raw = f.read()
+            legacy = orjson.loads(raw) if orjson else json.loads(raw)
+        except FileNotFoundError:
+            return
         except Exception as e:
             logging.error(f"Failed to load stats: {e}")
-            return {}
-            
-    def _save_stats(self):
-        """Save stats to JSON file."""
-        try:
-            with open(STATS_FILE, 'w') as f:
-                json.dump(self._stats, f, indent=2)
-        except Exception as e:
-            logging.error(f"Failed to save stats: {e}")
-
+            return
+        
+        rows = [
+            (user_id, platform, count)
+            for user_id, user_stats in legacy.items()
+            for platform, count in user_stats.get("platforms", {}).items()
+        ]
+        with self._lock, self._db:
+            self._db.execute("BEGIN")
+            self._db.executemany(
+                "INSERT OR REPLACE INTO stats (user_id, platform, count) VALUES (?, ?, ?)",
+                rows
+            )
+        logging.info(f"📊 Imported {len(rows)} stats rows from {STATS_FILE}")
+    
     def increment_download(self, user_id: str, platform: str):
         """Increment download count for a user and platform."""
-        user_id = str(user_id)
-        
-        if user_id not in self._stats:
-            self._stats[user_id] = {
-                "total_downloads": 0,
-                "platforms": {}
-            }
-            
-        user_stats = self._stats[user_id]
-        user_stats["total_downloads"] += 1
-        
-        # Function-level platform stats
-        if platform not in user_stats["platforms"]:
-            user_stats["platforms"][platform] = 0
-        user_stats["platforms"][platform] += 1
-        
-        self._save_stats()
-        
+        try:
+            with self._lock:
+                self._db.execute(
+                    "INSERT INTO stats (user_id, platform, count) VALUES (?, ?, 1) "
+                    "ON CONFLICT (user_id, platform) DO UPDATE SET count = count + 1",
+                    (str(user_id), platform)
+                )
+        except sqlite3.Error as e:
+            logging.error(f"Failed to save stats: {e}")
+    
     def get_user_stats(self, user_id: str) -> Dict[str, Any]:
         """Get stats for a specific user."""
-        return self._stats.get(str(user_id), {
-            "total_downloads": 0,
-            "platforms": {}
-        })
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT platform, count FROM stats WHERE user_id = ?",
+                (str(user_id),)
+            ).fetchall()
+        platforms = dict(rows)
+        return {
+            "total_downloads": sum(platforms.values()),
+            "platforms": platforms
+        }
 
 # Global instance
 stats_manager = StatsManager()
@@ -1,27 +1,314 @@
 """Gallery-dl wrapper for Instagram, TikTok, Twitter, and Facebook downloads."""
 
 import os
+import re
+import json
 import time
 import asyncio
+import collections
 import logging
-from typing import Dict, Optional
+import shutil
+import functools
+import threading
+from typing import Dict, List, Optional
+
+from auth.cookies import DIR_CACHE_SETTLE_NS
+
+# watchdog (optional - event-driven tracking of new downloads)
+try:
+    from watchdog.observers import Observer
+    WATCHDOG_AVAILABLE = True
+except ImportError:
+    WATCHDOG_AVAILABLE = False
+# gallery-dl as a library (optional - in-process downloads)
+try:
+    from gallery_dl import config as gdl_config, exception as gdl_exception, job as gdl_job
+    GALLERY_DL_AVAILABLE = True
+except ImportError:
+    GALLERY_DL_AVAILABLE = False
+
+# Default for how long a download process may go without output or I/O
+# before it is killed (seconds); gallery-dl's silent retry sleeps after an
+# HTTP 429 alone last 60s
+GDL_STALL_TIMEOUT = 300
+
+# Back-off before retrying a download that stalled (seconds, doubled per attempt)
+STALL_RETRY_DELAY = 30
+
+# How often a running process is checked for progress (seconds)
+STALL_CHECK_INTERVAL = 5
+
+# Platforms retried with yt-dlp when gallery-dl fails
+FALLBACK_PLATFORMS = ("Facebook", "TikTok", "Twitter", "Snapchat")
+
+# Platforms whose gallery-dl downloads use cookies.txt files
+COOKIE_PLATFORMS = ("Instagram", "Facebook")
+
+# Transient failures worth retrying, matched in one case-insensitive pass
+RETRYABLE_RE = re.compile(r'timeout|connection|network|temporary|rate[ -]?limit|try again', re.IGNORECASE)
+
+# Keyword fallback for failures gallery-dl didn't report in its usual format
+FAILURE_KEYWORDS_RE = re.compile(
+    r'(?P<auth>login|authentication)|(?P<not_found>404|not found)|(?P<retry>' + RETRYABLE_RE.pattern + ')',
+    re.IGNORECASE
+)
+
+# gallery-dl's own default log format, pinned so user configs can't change it
+GDL_LOG_FORMAT = '[{name}][{levelname}] {message}'
+GDL_ERROR_RE = re.compile(r'^\[[^\]\n]*\]\[error\] (?:(?P<exc>\w+): )?(?P<message>.*)$', re.MULTILINE)
+HTTP_STATUS_RE = re.compile(r"'(\d{3}) ")
+# stderr lines reporting an error (gallery-dl, yt-dlp), logged as warnings
+STDERR_ERROR_RE = re.compile(rb'^(?:\[[^\]\n]*\]\[error\]|ERROR:)')
+# Logged by gallery-dl before it sleeps out a rate limit
+GDL_WAIT_RE = re.compile(rb'\]\[info\] Waiting for .* until (\d\d):(\d\d):(\d\d) ')
+
+# gallery-dl exception classes and HTTP statuses -> failure kind
+GDL_ERROR_KINDS = {
+    'AuthenticationError': 'auth',
+    'AuthorizationError': 'auth',
+    'AuthRequired': 'auth',
+    'NotFoundError': 'not_found',
+    'NoExtractorError': 'unsupported',
+}
+HTTP_STATUS_KINDS = {401: 'auth', 403: 'auth', 404: 'not_found', 410: 'not_found', 429: 'retry'}
+
+# Bits gallery-dl ORs into its exit status
+GDL_EXIT_AUTH = 16
+GDL_EXIT_INPUT = 32  # InputError (NoExtractorError's own code)
+GDL_EXIT_NO_EXTRACTOR = 64  # what the CLI sets for an unsupported URL
+GDL_EXIT_OSERROR = 128
+
+# Failure kind -> (error, details) returned to the caller
+FAILURE_RESPONSES = {
+    'auth': ('Authentication required', 'Please provide cookies.txt file for Instagram'),
+    'not_found': ('Content not found', 'The content may have been deleted or is private'),
+    'unsupported': (
+        'Platform not supported or restricted',
+        'This video may require login, be private, or from an unsupported format'
+    ),
+}
+
+# Verbose failures can dump megabytes of tracebacks; only the tail is kept
+STDERR_TAIL_BYTES = 8192
+STDERR_TAIL_LINES = 200
+
+# Hidden sidecar in output_path holding the persisted directory listings
+SNAPSHOT_NAME = '.gdl_snapshot'
+
+# Cookie files are named <platform>.txt (default) or <platform>_<user_id>.txt
+COOKIE_FILE_RE = re.compile(r'^([a-z]+)(?:_(\w+))?\.txt$')
+
+# Directories already created by an earlier downloader in this process
+_ensured_dirs: set = set()
+
+
+@functools.lru_cache(maxsize=None)
+def _executable(name: str) -> str:
+    """
+    Resolve a program on PATH once.
+    
+    Spawning by absolute path spares the child an execve() attempt per
+    PATH entry; unresolved names are passed through unchanged so a
+    missing tool still surfaces as FileNotFoundError.
+    """
+    return shutil.which(name) or name
+
+
+async def _discard_line(stream: asyncio.StreamReader, consumed: int) -> None:
+    """
+    Drop an over-long line from a stream, up to and including its newline.
+    
+    Args:
+        stream: Reader that just raised LimitOverrunError
+        consumed: The error's ``consumed`` count (bytes known not to hold a newline)
+    """
+    while True:
+        try:
+            await stream.readexactly(consumed)
+            await stream.readuntil(b'\n')
+            return
+        except asyncio.LimitOverrunError as e:
+            consumed = e.consumed
+        except asyncio.IncompleteReadError:
+            return  # EOF before the newline
+
+
+# gallery-dl's configuration is process-global; one in-process run at a time
+_GDL_CONFIG_LOCK = threading.Lock()
+
+
+class _ThreadLogCapture(logging.Handler):
+    """Collects log records emitted by the creating thread, formatted like gallery-dl's stderr."""
+    
+    def __init__(self):
+        super().__init__()
+        self._thread_id = threading.get_ident()
+        self.lines = collections.deque(maxlen=STDERR_TAIL_LINES)
+    
+    def emit(self, record):
+        if record.thread == self._thread_id:
+            self.lines.append(f"[{record.name}][{record.levelname.lower()}] {record.getMessage()}")
+
+
+class _CreatedFilesHandler:
+    """watchdog event handler that records files created or moved into place."""
+    
+    def __init__(self):
+        self.paths = {}
+        self.marker = None
+        self.marker_seen = threading.Event()
+    
+    def dispatch(self, event):
+        if event.is_directory:
+            return
+        if event.event_type == 'created':
+            path = event.src_path
+        elif event.event_type == 'moved':
+            path = event.dest_path
+        else:
+            return
+        if path == self.marker:
+            self.marker_seen.set()
+        elif not os.path.basename(path).startswith('.'):  # Skip hidden files
+            self.paths[path] = None
+
+
+class _NewFileTracker:
+    """
+    Tracks files that appear under a directory while a download runs.
+    
+    With watchdog installed, an inotify/FSEvents observer on the job's own
+    target directory records only the files created during the download, so
+    the cost scales with that directory instead of the whole downloads tree.
+    Otherwise it falls back to diffing two (cached) walks of the tree.
+    
+    Setting up watches and walking the tree are blocking filesystem work,
+    so they run in a worker thread rather than on the event loop.
+    """
+    
+    def __init__(self, downloader: "GalleryDLDownloader", target_dir: str):
+        self._downloader = downloader
+        self._target_dir = target_dir
+        self._observer = None
+        self._handler = None
+        self._files_before = None
+        self._syncs = 0
+        self._lock = threading.Lock()
+    
+    async def __aenter__(self):
+        await asyncio.to_thread(self._start)
+        return self
+    
+    async def __aexit__(self, *exc):
+        if self._observer:
+            await asyncio.to_thread(self._stop)
+    
+    async def new_files(self) -> List[str]:
+        """Return files created since the tracker was entered (Async)."""
+        return await asyncio.to_thread(self._collect)
+    
+    def _start(self):
+        if WATCHDOG_AVAILABLE:
+            try:
+                # Must exist before it can be watched
+                os.makedirs(self._target_dir, exist_ok=True)
+                self._handler = _CreatedFilesHandler()
+                self._observer = Observer()
+                self._observer.schedule(self._handler, self._target_dir, recursive=True)
+                self._observer.start()
+                return
+            except OSError as e:
+                logging.debug("File watcher unavailable, scanning instead: %s", e)
+                self._observer = None
+        self._files_before = self._downloader._get_download_files()
+    
+    def _stop(self):
+        self._observer.stop()
+        self._observer.join()
+    
+    def _sync(self, timeout: float = 2.0):
+        """
+        Wait until the observer has delivered every event queued so far.
+        
+        Events are delivered in order, so once the creation of a fresh marker
+        file has been seen, all earlier creations have been recorded too.
+        """
+        self._syncs += 1
+        marker = os.path.join(self._target_dir, f".storyflow-sync-{os.getpid()}-{id(self)}-{self._syncs}")
+        self._handler.marker_seen.clear()
+        self._handler.marker = marker
+        try:
+            open(marker, 'w').close()
+            if not self._handler.marker_seen.wait(timeout):
+                logging.debug("File watcher did not catch up in time")
+        except OSError as e:
+            logging.debug("File watcher sync failed: %s", e)
+        finally:
+            try:
+                os.unlink(marker)
+            except OSError:
+                pass
+    
+    def _collect(self) -> List[str]:
+        # One sync marker at a time (gallery-dl and a raced yt-dlp share a tracker)
+        with self._lock:
+            if self._observer:
+                self._sync()
+                # Temporary files (e.g. *.part) are created and then renamed away
+                return [p for p in list(self._handler.paths) if os.path.isfile(p)]
+            return self._downloader._new_files_since(self._files_before)
 
 
 class GalleryDLDownloader:
     """Handler for general media downloads using gallery-dl."""
     
-    def __init__(self, output_path: str = './downloads', cookie_path: str = './cookies'):
+    def __init__(
+        self,
+        output_path: str = './downloads',
+        cookie_path: str = './cookies',
+        max_parallel: int = 3,
+        race_fallback: bool = False,
+        in_process: bool = False,
+        stall_timeout: float = GDL_STALL_TIMEOUT
+    ):
         """
         Initialize gallery-dl downloader.
         
         Args:
             output_path: Directory to save downloaded media
             cookie_path: Directory containing cookie files
+            max_parallel: Maximum number of downloads running at once
+            race_fallback: Run the yt-dlp fallback alongside gallery-dl instead
+                of after it fails (faster failures, twice the requests)
+            in_process: Call gallery-dl as a library instead of spawning a
+                process per download (needs the gallery_dl package; runs one
+                download at a time and can't be timed out)
+            stall_timeout: Kill a download process after this many seconds
+                without output or I/O; announced rate-limit waits don't count
         """
         self.output_path = output_path
         self.cookie_path = cookie_path
-        os.makedirs(output_path, exist_ok=True)
-        os.makedirs(cookie_path, exist_ok=True)
+        self.race_fallback = race_fallback
+        self.stall_timeout = stall_timeout
+        self.in_process = in_process and GALLERY_DL_AVAILABLE
+        if in_process and not GALLERY_DL_AVAILABLE:
+            logging.warning("⚠️ gallery_dl package not importable, using the gallery-dl command instead")
+        self._sem = asyncio.Semaphore(max_parallel)
+        # dirpath -> (mtime_ns, files, subdirs) for _get_download_files,
+        # persisted so a restart doesn't have to re-list the whole tree
+        self._snapshot_path = os.path.join(output_path, SNAPSHOT_NAME)
+        self._dir_cache: Dict[str, tuple] = self._load_snapshot()
+        # Walks run in worker threads; one at a time keeps the cache consistent
+        self._walk_lock = threading.Lock()
+        # (platform, user_id or None) -> cookie file path, refreshed when the
+        # cookie directory mtime changes
+        self._cookie_index: Dict[tuple, str] = {}
+        self._cookie_dir_mtime_ns = 0
+        for path in (output_path, cookie_path):
+            if path not in _ensured_dirs:
+                os.makedirs(path, exist_ok=True)
+                _ensured_dirs.add(path)
+        self.reload_cookies()
     
     async def download(self, url: str, platform: str, user_id: Optional[str] = None) -> Dict:
         """
@@ -35,93 +322,339 @@ class GalleryDLDownloader:
         Returns:
             Dict containing status and download information
         """
-        try:
-            # Get list of files before download
-            files_before = self._get_download_files()
+        return await self.download_many([url], platform, user_id)
+    
+    async def download_many(self, urls: List[str], platform: str, user_id: Optional[str] = None) -> Dict:
+        """
+        Download several URLs of one platform with a single gallery-dl run (Async).
+        
+        gallery-dl accepts any number of URLs, so batching them pays the
+        interpreter/extractor/cookie startup cost once instead of per URL.
+        
+        Args:
+            urls: Media URLs, all belonging to ``platform``
+            platform: Platform name (Instagram, TikTok, etc.)
+            user_id: User ID for cookie lookup (optional)
             
-            command = self._build_command(url, platform, user_id)
+        Returns:
+            Dict containing status and download information for the batch
+        """
+        async with self._sem:
+            return await self._download_batch(urls, platform, user_id)
+    
+    async def download_all(self, jobs: List[Dict]) -> List[Dict]:
+        """
+        Run several independent downloads concurrently (Async).
+        
+        At most ``max_parallel`` downloads run at a time; the rest wait on
+        the shared semaphore.
+        
+        Args:
+            jobs: Keyword arguments for download(), e.g.
+                ``{'url': ..., 'platform': ..., 'user_id': ...}``
             
-            logging.info(f"📥 Downloading {platform} content via gallery-dl...")
-            logging.debug(f"Command: {' '.join(command)}")
+        Returns:
+            List of download results in the same order as ``jobs``
+        """
+        async with asyncio.TaskGroup() as tg:
+            tasks = [tg.create_task(self.download(**job)) for job in jobs]
+        return [task.result() for task in tasks]
+    
+    async def _download_batch(self, urls: List[str], platform: str, user_id: Optional[str]) -> Dict:
+        """Run gallery-dl for a batch of URLs, falling back to yt-dlp (Async)."""
+        try:
+            # gallery-dl's default directories start with the extractor category
+            # and the yt-dlp template with the platform, both platform.lower()
+            async with _NewFileTracker(self, os.path.join(self.output_path, platform.lower())) as tracker:
+                return await self._run_batch(urls, platform, user_id, tracker)
+        except Exception as e:
+            logging.error("❌ Unexpected error: %s", e)
+            return {
+                'success': False,
+                'error': 'Unexpected error',
+                'details': str(e),
+                'platform': platform
+            }
+    
+    async def _run_batch(self, urls: List[str], platform: str, user_id: Optional[str], tracker: _NewFileTracker) -> Dict:
+        """Download a batch while ``tracker`` records the files it creates (Async)."""
+        if self.in_process:
+            command = None
+            run_attempt = functools.partial(self._run_in_process, urls, self._select_cookies(platform, user_id))
+            logging.info("📥 Downloading %s content via gallery-dl in-process (%s URL(s))...", platform, len(urls))
+        else:
+            command = self._build_command(urls, platform, user_id)
+            run_attempt = None
+            logging.info("📥 Downloading %s content via gallery-dl (%s URL(s))...", platform, len(urls))
+            if logging.getLogger().isEnabledFor(logging.DEBUG):
+                logging.debug("Command: %s", ' '.join(command))
+        
+        gdl_task = fallback_task = None
+        try:
+            if self.race_fallback and platform in FALLBACK_PLATFORMS:
+                # Start yt-dlp alongside gallery-dl and keep whichever succeeds first
+                logging.info("🔄 Racing yt-dlp fallback for %s...", platform)
+                gdl_task = asyncio.create_task(self._execute_with_retry(command, run_attempt=run_attempt))
+                fallback_task = asyncio.create_task(self._fallback_each(urls, platform, user_id, tracker))
+                done, _ = await asyncio.wait({gdl_task, fallback_task}, return_when=asyncio.FIRST_COMPLETED)
+                if fallback_task in done and fallback_task.result()['success']:
+                    logging.info("🏁 yt-dlp finished %s download first", platform)
+                    return fallback_task.result()
+                result = await gdl_task
+            else:
+                # Execute gallery-dl with retry logic (Async)
+                result = await self._execute_with_retry(command, run_attempt=run_attempt)
             
-            # Execute gallery-dl with retry logic (Async)
-            result = await self._execute_with_retry(command)
+            return await self._finish_batch(result, urls, platform, user_id, tracker, fallback_task)
+        finally:
+            # Cancelling kills the losing subprocess
+            for task in (gdl_task, fallback_task):
+                if task and not task.done():
+                    task.cancel()
+    
+    async def _finish_batch(
+        self,
+        result: Dict,
+        urls: List[str],
+        platform: str,
+        user_id: Optional[str],
+        tracker: _NewFileTracker,
+        fallback_task: Optional[asyncio.Task]
+    ) -> Dict:
+        """Turn a gallery-dl result into the final one, using yt-dlp if it failed (Async)."""
+        # gallery-dl reports every file it wrote or found already present.
+        # When it did, that list is authoritative: the download directory is
+        # shared, so scanning it could pick up another job's files. stdout is
+        # None when there was no pipe output (in-process run, killed process).
+        stdout = result.get('stdout')
+        reported = stdout is not None
+        downloaded, skipped = self._parse_reported_files(stdout or '')
+        
+        if result['success']:
+            # Find new files
+            new_files = downloaded + skipped if reported else await tracker.new_files()
             
-            if result['success']:
-                # Find new files
-                files_after = self._get_download_files()
-                new_files = [f for f in files_after if f not in files_before]
-                
-                if new_files:
-                    logging.info(f"✅ {platform} content downloaded successfully! ({len(new_files)} files)")
-                    result['files'] = new_files
-                else:
-                    # No new files - but gallery-dl succeeded, so content might be cached
-                    # Return all existing files in the download directory
-                    all_files = list(files_after)
-                    if all_files:
-                        logging.info(f"📂 Content already downloaded, returning {len(all_files)} cached file(s)")
-                        result['files'] = all_files
-                    else:
-                        logging.warning(f"⚠️ No files found in download directory")
-                        result['files'] = []
-                        result['message'] = "No content available"
-                    
-                return result
+            if new_files:
+                logging.info("✅ %s content downloaded successfully! (%s files)", platform, len(new_files))
+                result['files'] = new_files
             else:
-                # Check for partial success (files downloaded despite error)
-                files_after = self._get_download_files()
-                new_files = [f for f in files_after if f not in files_before]
-                
-                if new_files:
-                    # TikTok specific: Images often download fine but audio fails. Treat this as success/feature.
-                    logging.info(f"✅ {platform} images downloaded successfully (audio skipped by design)")
-                    result['success'] = True
-                    result['files'] = new_files
-                    result['message'] = "Downloads completed (audio skipped)"
-                    return result
-                    
-                # gallery-dl failed - try yt-dlp as fallback for supported platforms
-                fallback_platforms = ["Facebook", "TikTok", "Twitter", "Snapchat"]
-                if platform in fallback_platforms:
-                    # If gallery-dl specifically found no content (Code 4), we might still try fallback
-                    # but if fallback also fails, we should remember the "No content" signal.
-                    logging.info(f"🔄 Trying yt-dlp fallback for {platform}...")
-                    fallback_result = await self._download_with_ytdlp(url, platform, user_id, files_before)
-                    if fallback_result['success']:
-                        return fallback_result
-                    else:
-                        # If gallery-dl said "No content" (Code 4) and yt-dlp failed, return the "No content" message
-                        if result.get('returncode') == 4:
-                             return result 
-
-                        # Return fallback error if we tried it
-                        logging.warning(f"⚠️ Fallback failed: {fallback_result.get('error')}")
-                        return fallback_result
+                # Nothing tracked either - the content might be cached, so
+                # return everything in the download directory
+                all_files = [] if reported else list(await asyncio.to_thread(self._get_download_files))
+                if all_files:
+                    logging.info("📂 Content already downloaded, returning %s cached file(s)", len(all_files))
+                    result['files'] = all_files
+                else:
+                    logging.warning("⚠️ No files found in download directory")
+                    result['files'] = []
+                    result['message'] = "No content available"
                 
-                logging.error(f"❌ Download failed: {result.get('error')}")
+            return result
+        else:
+            # Check for partial success (files downloaded despite error)
+            new_files = downloaded if reported else await tracker.new_files()
+            
+            if new_files:
+                # TikTok specific: Images often download fine but audio fails. Treat this as success/feature.
+                logging.info("✅ %s images downloaded successfully (audio skipped by design)", platform)
+                result['success'] = True
+                result['files'] = new_files
+                result['message'] = "Downloads completed (audio skipped)"
                 return result
-
                 
-        except Exception as e:
-            logging.error(f"❌ Unexpected error: {e}")
+            # gallery-dl failed - try yt-dlp as fallback for supported platforms
+            if platform in FALLBACK_PLATFORMS:
+                if fallback_task:
+                    fallback_result = await fallback_task
+                else:
+                    logging.info("🔄 Trying yt-dlp fallback for %s...", platform)
+                    fallback_result = await self._fallback_each(urls, platform, user_id, tracker)
+                if fallback_result['success']:
+                    return fallback_result
+                
+                # Return fallback error if we tried it
+                logging.warning("⚠️ Fallback failed: %s", fallback_result.get('error'))
+                return fallback_result
+            
+            logging.error("❌ Download failed: %s", result.get('error'))
+            return result
+    
+    @staticmethod
+    def _parse_reported_files(stdout: str) -> tuple:
+        """
+        Split gallery-dl's pipe output into (downloaded, skipped) file paths.
+        
+        In pipe mode gallery-dl prints each downloaded file's path on its own
+        line and prefixes files it skipped as already present with "# ".
+        """
+        downloaded = []
+        skipped = []
+        for line in stdout.splitlines():
+            if line.startswith('# '):
+                skipped.append(line[2:])
+            elif line:
+                downloaded.append(line)
+        return downloaded, skipped
+    
+    async def _fallback_each(self, urls: List[str], platform: str, user_id: Optional[str], tracker: _NewFileTracker) -> Dict:
+        """
+        Re-run each URL of a failed batch individually through yt-dlp.
+        
+        yt-dlp is invoked with ``--no-playlist`` per URL, so URLs are retried
+        one at a time and their files are merged into one result.
+        
+        Returns:
+            Dict with the merged download result
+        """
+        if len(urls) == 1:
+            return await self._download_with_ytdlp(urls[0], platform, user_id, tracker)
+        
+        # Every run reports all files seen by the same tracker, so de-duplicate in order
+        files = {}
+        last_failure = None
+        for url in urls:
+            result = await self._download_with_ytdlp(url, platform, user_id, tracker)
+            if result['success']:
+                files.update(dict.fromkeys(result['files']))
+            else:
+                last_failure = result
+        
+        if files:
             return {
-                'success': False,
-                'error': 'Unexpected error',
-                'details': str(e),
+                'success': True,
+                'files': list(files),
                 'platform': platform
             }
+        return last_failure
     
     def _get_download_files(self) -> set:
         """Get set of all files currently in download directory."""
         files = set()
-        for root, dirs, filenames in os.walk(self.output_path):
-            for filename in filenames:
-                if not filename.startswith('.'):  # Skip hidden files
-                    files.add(os.path.join(root, filename))
+        with self._walk_lock:
+            for dir_files in self._walk_listings():
+                files.update(dir_files)
         return files
     
-    async def _download_with_ytdlp(self, url: str, platform: str, user_id: Optional[str], files_before: set) -> Dict:
+    def _new_files_since(self, before: set) -> List[str]:
+        """List files in the download directory that are not in ``before``."""
+        with self._walk_lock:
+            return [path for dir_files in self._walk_listings() for path in dir_files if path not in before]
+    
+    def _walk_listings(self):
+        """
+        Yield the visible files of each directory under output_path.
+        
+        A directory's mtime only changes when entries are added to or removed
+        from it, so unchanged directories reuse their cached listing and only
+        cost one stat; subdirectories are still visited individually.
+        """
+        changed = False
+        visited = set()
+        pending = [self.output_path]
+        while pending:
+            root = pending.pop()
+            visited.add(root)
+            try:
+                mtime = os.stat(root).st_mtime_ns
+            except OSError:
+                self._dir_cache.pop(root, None)
+                continue
+            
+            cached = self._dir_cache.get(root)
+            if cached and cached[0] == mtime:
+                dir_files, subdirs = cached[1], cached[2]
+            else:
+                listed_at = time.time_ns()
+                dir_files, subdirs = self._list_dir(root)
+                # A listing taken in the same mtime tick as a change could miss
+                # later writes in that tick, so only trust settled directories
+                if listed_at - mtime > DIR_CACHE_SETTLE_NS:
+                    self._dir_cache[root] = (mtime, dir_files, subdirs)
+                else:
+                    self._dir_cache.pop(root, None)
+                # Only content changes are worth persisting; an entry whose mtime
+                # alone went stale is simply re-listed once after a restart
+                changed = changed or not cached or cached[1:] != (dir_files, subdirs)
+            
+            yield dir_files
+            pending.extend(subdirs)
+        
+        # Drop directories that are gone (or no longer reachable) so the
+        # snapshot doesn't keep growing
+        stale = self._dir_cache.keys() - visited
+        for root in stale:
+            del self._dir_cache[root]
+        
+        if changed or stale:
+            self._save_snapshot()
+    
+    def _load_snapshot(self) -> Dict[str, tuple]:
+        """
+        Load the persisted directory listing cache, or start empty.
+        
+        The snapshot lives in the (possibly shared) download directory, so it
+        is plain JSON and every entry must describe a directory under
+        output_path and only list that directory's own children.
+        """
+        try:
+            with open(self._snapshot_path, 'rb') as f:
+                snapshot = json.load(f)
+            
+            root_prefix = os.path.join(self.output_path, '')
+            cache = {}
+            for root, (mtime, dir_files, subdirs) in snapshot.items():
+                if root != self.output_path and not root.startswith(root_prefix):
+                    continue
+                if not all(os.path.join(root, os.path.basename(path)) == path for path in (*dir_files, *subdirs)):
+                    continue
+                cache[root] = (int(mtime), frozenset(dir_files), tuple(subdirs))
+            return cache
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            logging.debug("Ignoring unreadable download snapshot: %s", e)
+        return {}
+    
+    def _save_snapshot(self):
+        """Atomically persist the directory listing cache as JSON."""
+        snapshot = {
+            root: [mtime, sorted(dir_files), list(subdirs)]
+            for root, (mtime, dir_files, subdirs) in self._dir_cache.items()
+        }
+        tmp_path = f"{self._snapshot_path}.tmp"
+        try:
+            with open(tmp_path, 'w') as f:
+                json.dump(snapshot, f)
+            os.replace(tmp_path, self._snapshot_path)
+        except OSError as e:
+            logging.debug("Failed to save download snapshot: %s", e)
+    
+    @classmethod
+    def _iter_files(cls, root: str):
+        """Yield visible file paths under root (missing root yields nothing)."""
+        dir_files, subdirs = cls._list_dir(root)
+        yield from dir_files
+        for subdir in subdirs:
+            yield from cls._iter_files(subdir)
+    
+    @staticmethod
+    def _list_dir(root: str) -> tuple:
+        """List one directory into (visible file paths, subdirectory paths)."""
+        dir_files = []
+        subdirs = []
+        try:
+            with os.scandir(root) as it:
+                for entry in it:
+                    if entry.is_dir():
+                        if not entry.is_symlink():  # Like os.walk, don't follow dir links
+                            subdirs.append(entry.path)
+                    elif not entry.name.startswith('.'):  # Skip hidden files
+                        dir_files.append(entry.path)
+        except OSError:
+            pass
+        return frozenset(dir_files), tuple(subdirs)
+    
+    async def _download_with_ytdlp(self, url: str, platform: str, user_id: Optional[str], tracker: _NewFileTracker) -> Dict:
         """
         Fallback download using yt-dlp for platforms where gallery-dl fails (Async).
         
@@ -129,7 +662,7 @@ class GalleryDLDownloader:
             url: Media URL
             platform: Platform name
             user_id: User ID for cookie lookup
-            files_before: Set of files before download
+            tracker: Tracker recording files created by this download
             
         Returns:
             Dict with download result
@@ -138,21 +671,23 @@ class GalleryDLDownloader:
             # Build yt-dlp command
             output_template = os.path.join(self.output_path, f'{platform.lower()}', '%(id)s.%(ext)s')
             command = [
-                'yt-dlp',
+                _executable('yt-dlp'),
                 '-o', output_template,
                 '--no-warnings',
                 '--no-playlist',
+                # Print the final path of every file once it is in place
+                '--print', 'after_move:filepath',
             ]
             
             # Add cookies if available
-            cookie_file = os.path.join(self.cookie_path, f"{platform.lower()}_{user_id}.txt") if user_id else None
-            if cookie_file and os.path.exists(cookie_file):
-                logging.info(f"🍪 Using {platform} cookies with yt-dlp")
+            cookie_file = self._cookie_file(platform, user_id) if user_id else None
+            if cookie_file:
+                logging.info("🍪 Using %s cookies with yt-dlp", platform)
                 command.extend(['--cookies', cookie_file])
             
             command.append(url)
             
-            logging.info(f"📥 Downloading {platform} content via yt-dlp...")
+            logging.info("📥 Downloading %s content via yt-dlp...", platform)
             
             # Run yt-dlp asynchronously
             process = await asyncio.create_subprocess_exec(
@@ -161,15 +696,16 @@ class GalleryDLDownloader:
                 stderr=asyncio.subprocess.PIPE
             )
             
-            stdout, stderr = await process.communicate()
+            stdout, stderr = await self._communicate_streaming(
+                process, os.path.basename(command[0]), stall_timeout=self.stall_timeout
+            )
             
             if process.returncode == 0:
                 # Find new files
-                files_after = self._get_download_files()
-                new_files = [f for f in files_after if f not in files_before]
+                new_files = [f for f in stdout.decode(errors='replace').splitlines() if f] or await tracker.new_files()
                 
                 if new_files:
-                    logging.info(f"✅ {platform} content downloaded via yt-dlp! ({len(new_files)} files)")
+                    logging.info("✅ %s content downloaded via yt-dlp! (%s files)", platform, len(new_files))
                     return {
                         'success': True,
                         'files': new_files,
@@ -179,28 +715,23 @@ class GalleryDLDownloader:
                     # If yt-dlp succeeded but no *new* files, content might be cached/already downloaded
                     # Return all appropriate files from the platform directory
                     platform_dir = os.path.join(self.output_path, platform.lower())
-                    if os.path.exists(platform_dir) and os.listdir(platform_dir):
-                        all_files = [
-                            os.path.join(root, f) 
-                            for root, _, files in os.walk(platform_dir) 
-                            for f in files if not f.startswith('.')
-                        ]
-                        if all_files:
-                            logging.info(f"📂 Content already downloded (cached), returning {len(all_files)} file(s)")
-                            return {
-                                'success': True,
-                                'files': all_files,
-                                'platform': platform
-                            }
-                            
+                    all_files = await asyncio.to_thread(list, self._iter_files(platform_dir))
+                    if all_files:
+                        logging.info("📂 Content already downloded (cached), returning %s file(s)", len(all_files))
+                        return {
+                            'success': True,
+                            'files': all_files,
+                            'platform': platform
+                        }
+                    
                     return {
                         'success': False,
                         'error': 'No files downloaded (and no cache found)',
                         'platform': platform
                     }
             else:
-                stderr_text = stderr.decode().strip()
-                logging.warning(f"⚠️ yt-dlp failed: {stderr_text[:200]}")
+                stderr_text = self._stderr_tail(stderr).strip()
+                logging.warning("⚠️ yt-dlp failed: %s", stderr_text[:200])
                 return {
                     'success': False,
                     'error': 'yt-dlp download failed',
@@ -222,164 +753,174 @@ class GalleryDLDownloader:
                 'platform': platform
             }
         except Exception as e:
-            logging.error(f"yt-dlp error: {e}")
+            logging.error("yt-dlp error: %s", e)
             return {
                 'success': False,
                 'error': str(e),
                 'platform': platform
             }
     
-    def _build_command(self, url: str, platform: str, user_id: Optional[str]) -> list:
-        """Build gallery-dl command with appropriate options."""
+    def reload_cookies(self):
+        """
+        Rebuild the cookie index from one scan of the cookie directory.
+        
+        Called at startup and whenever the directory mtime changes; can also be
+        called directly after writing or deleting a cookie file.
+        """
+        index = {}
+        try:
+            dir_mtime_ns = os.stat(self.cookie_path).st_mtime_ns
+            listed_at = time.time_ns()
+            with os.scandir(self.cookie_path) as it:
+                for entry in it:
+                    match = COOKIE_FILE_RE.match(entry.name)
+                    if match:
+                        index[(match.group(1), match.group(2))] = entry.path
+            # A scan taken in the same mtime tick as a change could miss later
+            # writes in that tick (e.g. an upload's os.replace), so only key the
+            # index on a settled mtime; otherwise the next lookup rescans
+            if listed_at - dir_mtime_ns <= DIR_CACHE_SETTLE_NS:
+                dir_mtime_ns = 0
+        except FileNotFoundError:
+            dir_mtime_ns = 0
+        self._cookie_index = index
+        self._cookie_dir_mtime_ns = dir_mtime_ns
+    
+    def _cookie_file(self, platform: str, user_id: Optional[str] = None) -> Optional[str]:
+        """
+        Return the cookie file for a platform (and user), if one exists.
+        
+        Lookups hit the prebuilt index; the only syscall is a stat of the
+        cookie directory to notice uploads and deletions (rescanning while
+        the directory changed too recently to trust its mtime).
+        
+        Args:
+            platform: Platform name
+            user_id: User ID, or None for the platform's default cookies
+        """
+        try:
+            dir_mtime_ns = os.stat(self.cookie_path).st_mtime_ns
+        except FileNotFoundError:
+            return None
+        if dir_mtime_ns != self._cookie_dir_mtime_ns:
+            self.reload_cookies()
+        
+        return self._cookie_index.get((platform.lower(), str(user_id) if user_id else None))
+    
+    def _select_cookies(self, platform: str, user_id: Optional[str]) -> Optional[str]:
+        """Pick the cookie file for a gallery-dl download, if the platform uses one."""
+        if platform not in COOKIE_PLATFORMS:
+            return None
+        
+        if user_id:
+            cookie_file = self._cookie_file(platform, user_id)
+            if cookie_file:
+                logging.info("🍪 Using %s cookies for authentication", platform)
+            else:
+                logging.warning("⚠️ No %s cookie file found for user %s", platform, user_id)
+            return cookie_file
+        
+        # Check for general cookies
+        default_cookie = self._cookie_file(platform)
+        if default_cookie:
+            logging.info("🍪 Using default %s cookies", platform)
+        return default_cookie
+    
+    def _build_command(self, urls: List[str], platform: str, user_id: Optional[str]) -> list:
+        """Build gallery-dl command with appropriate options for one or more URLs."""
         command = [
-            'gallery-dl',
+            _executable('gallery-dl'),
             '-d', self.output_path,
             '--no-mtime',  # Don't set file modification time
+            # Print one path per file on stdout ("# path" when already present)
+            '-o', 'output.mode=pipe',
+            '-o', 'output.skip=true',
+            # Keep stderr in the default "[category][level] message" format
+            '-o', f'output.log={GDL_LOG_FORMAT}',
         ]
         
-        # Add cookie support for Instagram
-        if platform == "Instagram" and user_id:
-            cookie_file = os.path.join(self.cookie_path, f"instagram_{user_id}.txt")
-            if os.path.exists(cookie_file):
-                logging.info(f"🍪 Using Instagram cookies for authentication")
-                command.extend(['--cookies', cookie_file])
-            else:
-                logging.warning(f"⚠️ No Instagram cookie file found for user {user_id}")
-        
-        # Check for general Instagram cookies
-        elif platform == "Instagram":
-            default_cookie = os.path.join(self.cookie_path, "instagram.txt")
-            if os.path.exists(default_cookie):
-                logging.info("🍪 Using default Instagram cookies")
-                command.extend(['--cookies', default_cookie])
-        
-        # Add cookie support for Facebook
-        if platform == "Facebook" and user_id:
-            cookie_file = os.path.join(self.cookie_path, f"facebook_{user_id}.txt")
-            if os.path.exists(cookie_file):
-                logging.info(f"🍪 Using Facebook cookies for authentication")
-                command.extend(['--cookies', cookie_file])
-            else:
-                logging.warning(f"⚠️ No Facebook cookie file found for user {user_id}")
+        # Add cookie support for platforms that need authentication
+        cookie_file = self._select_cookies(platform, user_id)
+        if cookie_file:
+            command.extend(['--cookies', cookie_file])
         
-        # Check for general Facebook cookies
-        elif platform == "Facebook":
-            default_cookie = os.path.join(self.cookie_path, "facebook.txt")
-            if os.path.exists(default_cookie):
-                logging.info("🍪 Using default Facebook cookies")
-                command.extend(['--cookies', default_cookie])
-        
-        # Add URL as final argument
-        command.append(url)
+        # Add URLs as final arguments
+        command.extend(urls)
         
         return command
     
-    async def _execute_with_retry(self, command: list, max_attempts: int = 3) -> Dict:
-        """Execute command with retry logic (Async)."""
+    async def _execute_with_retry(self, command: Optional[list], max_attempts: int = 3, run_attempt=None) -> Dict:
+        """
+        Execute command with retry logic (Async).
+        
+        Args:
+            command: gallery-dl command line
+            max_attempts: Attempts before giving up on retryable failures
+            run_attempt: Coroutine function performing one attempt and returning
+                (returncode, stdout, stderr); defaults to running ``command``
+            
+        Returns:
+            Dict with the outcome of the last attempt
+        """
+        if run_attempt is None:
+            run_attempt = functools.partial(self._run_command, command)
+        
         for attempt in range(1, max_attempts + 1):
             try:
-                # Async subprocess execution
-                process = await asyncio.create_subprocess_exec(
-                    *command,
-                    stdout=asyncio.subprocess.PIPE,
-                    stderr=asyncio.subprocess.PIPE
-                )
-                
-                # Wait for completion with timeout
-                try:
-                    stdout, stderr = await asyncio.wait_for(process.communicate(), timeout=300)
-                    
-                    stdout_text = stdout.decode()
-                    stderr_text = stderr.decode()
-                    
-                    if process.returncode == 0:
-                        return {
-                            'success': True,
-                            'stdout': stdout_text,
-                            'stderr': stderr_text,
-                            'platform': 'gallery-dl'
-                        }
-                    else:
-                        raise ValueError(f"Process failed using status {process.returncode}")
-                        
-                except asyncio.TimeoutError:
-                    process.kill()
-                    raise TimeoutError("Process exceeded 5 minutes")
-                
-            except (ValueError, TimeoutError) as e:
-                # Need to handle non-process errors or non-zero exits here
-                # Re-parse stderr from the failed process call if it was a non-zero exit
-                error_msg = str(e)
-                stderr_content = stderr_text if 'stderr_text' in locals() else ""
-                
-                logging.warning(f"⚠️ Attempt {attempt}/{max_attempts} failed")
-                if stderr_content:
-                    logging.debug(f"STDERR: {stderr_content}")
-                
-                # Check if it's an authentication error
-                if 'login' in stderr_content.lower() or 'authentication' in stderr_content.lower():
-                    return {
-                        'success': False,
-                        'error': 'Authentication required',
-                        'details': 'Please provide cookies.txt file for Instagram',
-                        'stderr': stderr_content,
-                        'platform': 'gallery-dl'
-                    }
-                
-                # Check for 404 or content not found
-                if '404' in stderr_content or 'not found' in stderr_content.lower():
-                    return {
-                        'success': False,
-                        'error': 'Content not found',
-                        'details': 'The content may have been deleted or is private',
-                        'stderr': stderr_content,
-                        'platform': 'gallery-dl',
-                        'returncode': process.returncode if 'process' in locals() else None
-                    }
-                
-                # Exit code 64 = extractor failure
-                if 'returncode' in locals() and process.returncode == 64:
-                    return {
-                        'success': False,
-                        'error': 'Platform not supported or restricted',
-                        'details': 'This video may require login, be private, or from an unsupported format',
-                        'stderr': stderr_content,
-                        'platform': 'gallery-dl',
-                        'returncode': 64
-                    }
-
-                # Exit code 4 = No Downloads / Nothing found (User has no stories)
-                if 'returncode' in locals() and process.returncode == 4:
-                    return {
-                        'success': False,
-                        'error': 'No active stories/spotlights found',
-                        'details': 'The user has no content available or it is private',
-                        'stderr': stderr_content,
-                        'platform': 'gallery-dl',
-                        'returncode': 4
-                    }
-                
-                # Retry on network errors
-                if attempt < max_attempts and self._is_retryable_error(stderr_content):
-                    wait_time = 2 ** attempt  # Exponential backoff
-                    logging.info(f"⏳ Retrying in {wait_time}s...")
-                    await asyncio.sleep(wait_time)
-                    continue
-                
+                returncode, stdout_content, stderr_content = await run_attempt()
+            except Exception as e:
+                logging.error("❌ Execution error: %s", e)
                 return {
                     'success': False,
-                    'error': f'Download failed (code {process.returncode if "process" in locals() else "?"})',
+                    'error': f'Internal error: {e}',
+                    'platform': 'gallery-dl'
+                }
+            
+            if returncode == 0:
+                return {
+                    'success': True,
+                    'stdout': stdout_content,
                     'stderr': stderr_content,
                     'platform': 'gallery-dl'
                 }
-                
-            except Exception as e:
-                logging.error(f"❌ Execution error: {e}")
+            
+            logging.warning("⚠️ Attempt %s/%s failed", attempt, max_attempts)
+            if stderr_content:
+                logging.debug("STDERR: %s", stderr_content)
+            
+            # No returncode means the process stalled and was killed
+            kind = self._classify_failure(stderr_content, returncode) if returncode is not None else 'retry'
+            
+            if kind in FAILURE_RESPONSES:
+                error, details = FAILURE_RESPONSES[kind]
                 return {
                     'success': False,
-                    'error': f'Internal error: {e}',
-                    'platform': 'gallery-dl'
+                    'error': error,
+                    'details': details,
+                    'stdout': stdout_content,
+                    'stderr': stderr_content,
+                    'platform': 'gallery-dl',
+                    'returncode': returncode
                 }
+            
+            # Retry on network errors
+            if attempt < max_attempts and kind == 'retry':
+                # Exponential backoff; a stall is often a rate limit, so back off longer
+                if returncode is None:
+                    wait_time = STALL_RETRY_DELAY * 2 ** (attempt - 1)
+                else:
+                    wait_time = 2 ** attempt
+                logging.info("⏳ Retrying in %ss...", wait_time)
+                await asyncio.sleep(wait_time)
+                continue
+            
+            return {
+                'success': False,
+                'error': 'Download stalled' if returncode is None else f'Download failed (code {returncode})',
+                'stdout': stdout_content,
+                'stderr': stderr_content,
+                'platform': 'gallery-dl'
+            }
         
         return {
             'success': False,
@@ -387,15 +928,268 @@ class GalleryDLDownloader:
             'platform': 'gallery-dl'
         }
     
+    async def _run_command(self, command: list) -> tuple:
+        """
+        Run gallery-dl once as a subprocess (Async).
+        
+        Returns:
+            Tuple of (returncode, stdout, stderr tail); returncode and stdout
+            are None if the process had to be killed
+        """
+        process = await asyncio.create_subprocess_exec(
+            *command,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE
+        )
+        
+        # Wait for completion; only a stalled process is cut short, however
+        # long a download that keeps progressing takes
+        try:
+            stdout, stderr = await self._communicate_streaming(
+                process, os.path.basename(command[0]), stall_timeout=self.stall_timeout
+            )
+        except asyncio.TimeoutError:
+            logging.warning("⏱️ Process made no progress for %gs, killed it", self.stall_timeout)
+            return None, None, ''
+        
+        # stderr is only inspected on failure, so don't decode it on success
+        stderr_text = self._stderr_tail(stderr) if process.returncode else ''
+        return process.returncode, stdout.decode(errors='replace'), stderr_text
+    
+    async def _run_in_process(self, urls: List[str], cookie_file: Optional[str]) -> tuple:
+        """
+        Run gallery-dl once as a library call in a worker thread (Async).
+        
+        gallery-dl's configuration is process-global, so runs are serialized
+        under _GDL_CONFIG_LOCK. A running job can't be interrupted, which means
+        stall detection and race_fallback cancellation don't apply to it.
+        
+        Returns:
+            Tuple of (exit status, stdout, captured log) like _run_command;
+            stdout is None because file paths aren't printed in-process
+        """
+        return await asyncio.to_thread(self._run_gallery_dl_jobs, urls, cookie_file)
+    
+    def _run_gallery_dl_jobs(self, urls: List[str], cookie_file: Optional[str]) -> tuple:
+        capture = _ThreadLogCapture()
+        root_logger = logging.getLogger()
+        root_logger.addHandler(capture)
+        try:
+            with _GDL_CONFIG_LOCK:
+                # Same settings _build_command passes on the command line
+                gdl_config.clear()
+                gdl_config.load()
+                gdl_config.set((), 'base-directory', self.output_path)
+                gdl_config.set((), 'mtime', False)
+                gdl_config.set((), 'cookies', cookie_file)
+                gdl_config.set(('output',), 'mode', 'null')
+                
+                status = 0
+                for url in urls:
+                    try:
+                        status |= gdl_job.DownloadJob(url).run()
+                    except gdl_exception.NoExtractorError:
+                        logging.getLogger('gallery-dl').error(f"Unsupported URL '{url}'")
+                        status |= GDL_EXIT_NO_EXTRACTOR
+        finally:
+            root_logger.removeHandler(capture)
+        return status, None, '\n'.join(capture.lines)
+    
+    async def _communicate_streaming(self, process, name: str, stall_timeout: Optional[float] = None) -> tuple:
+        """
+        Like process.communicate(), but logs output lines as they arrive (Async).
+        
+        stdout is kept in full (it lists the downloaded files); only the last
+        STDERR_TAIL_LINES lines of stderr are kept.
+        
+        Args:
+            process: Subprocess started with stdout and stderr pipes
+            name: Prefix for logged output lines
+            stall_timeout: Kill the process once it has gone this many seconds
+                without printing anything or doing any I/O (None = never);
+                a rate-limit wait gallery-dl announces is added on top
+            
+        Returns:
+            Tuple of (stdout bytes, stderr tail bytes)
+            
+        Raises:
+            asyncio.TimeoutError: The process stalled and was killed
+        """
+        out = []
+        err = collections.deque(maxlen=STDERR_TAIL_LINES)
+        last_activity = time.monotonic()
+        stalled = False
+        
+        def touch(line: bytes = b''):
+            nonlocal last_activity
+            # Never pull an announced wait's end back in
+            last_activity = max(last_activity, time.monotonic() + self._announced_wait(line))
+        
+        async def watch():
+            # A single big file downloads silently, so I/O counts as progress too
+            nonlocal stalled
+            io_bytes = self._process_io_bytes(process.pid)
+            while True:
+                await asyncio.sleep(STALL_CHECK_INTERVAL)
+                current = self._process_io_bytes(process.pid)
+                if current != io_bytes:
+                    io_bytes = current
+                    touch()
+                elif time.monotonic() - last_activity > stall_timeout:
+                    # Killing it ends the pipes, so the readers below finish
+                    stalled = True
+                    self._kill(process)
+                    return
+        
+        watcher = asyncio.create_task(watch()) if stall_timeout is not None else None
+        try:
+            await asyncio.gather(
+                self._drain(process.stdout, logging.INFO, out, name, touch),
+                self._drain(process.stderr, logging.DEBUG, err, name, touch, error_level=logging.WARNING),
+                process.wait()
+            )
+        except asyncio.CancelledError:
+            # Lost a fallback race (or the caller gave up); don't leave the process running
+            self._kill(process)
+            raise
+        finally:
+            if watcher:
+                watcher.cancel()
+        
+        if stalled:
+            raise asyncio.TimeoutError
+        return b''.join(out), b''.join(err)
+    
+    @staticmethod
+    def _announced_wait(line: bytes) -> float:
+        """Seconds gallery-dl said it will sleep for in a log line, else 0."""
+        match = GDL_WAIT_RE.search(line)
+        if not match:
+            return 0.0
+        # gallery-dl prints the local wall-clock time it waits until
+        hour, minute, second = map(int, match.groups())
+        now = time.localtime()
+        wait = (hour - now.tm_hour) * 3600 + (minute - now.tm_min) * 60 + (second - now.tm_sec)
+        return float(wait % 86400)
+    
+    @staticmethod
+    def _process_io_bytes(pid: int) -> Optional[int]:
+        """Bytes a process has read and written so far (Linux /proc), or None if unknown."""
+        try:
+            with open(f'/proc/{pid}/io', 'rb') as f:
+                counters = dict(line.split(b':', 1) for line in f.read().splitlines())
+            return int(counters[b'rchar']) + int(counters[b'wchar'])
+        except (OSError, KeyError, ValueError):
+            return None
+    
+    @staticmethod
+    def _kill(process):
+        """Kill a subprocess unless it has already exited."""
+        if process.returncode is None:
+            try:
+                process.kill()
+            except ProcessLookupError:
+                pass
+    
+    @staticmethod
+    async def _drain(stream, level: int, sink, name: str, on_line=None, error_level: Optional[int] = None):
+        """
+        Read a subprocess stream line by line into sink, logging each line.
+        
+        Args:
+            stream: Subprocess output stream
+            level: Log level for ordinary lines
+            sink: List (or deque) the raw lines are appended to
+            name: Prefix for logged lines
+            on_line: Optional callback given each line as it arrives
+            error_level: Log level for lines matching STDERR_ERROR_RE, if
+                they should stand out from the rest
+        """
+        # Lines are only decoded for the log; skip that when it'd be dropped
+        root_logger = logging.getLogger()
+        log_lines = root_logger.isEnabledFor(level)
+        log_errors = error_level is not None and root_logger.isEnabledFor(error_level)
+        while True:
+            try:
+                line = await stream.readuntil(b'\n')
+            except asyncio.IncompleteReadError as e:
+                line = e.partial  # Last line without a newline, or b'' at EOF
+            except asyncio.LimitOverrunError as e:
+                # Longer than the stream limit; drop all of it so its tail isn't
+                # read as a line of its own (stdout lines are taken as file paths)
+                await _discard_line(stream, e.consumed)
+                continue
+            if not line:
+                break
+            sink.append(line)
+            if on_line:
+                on_line(line)
+            if log_errors and STDERR_ERROR_RE.match(line):
+                logging.log(error_level, "[%s] %s", name, line.decode(errors='replace').rstrip())
+            elif log_lines:
+                logging.log(level, "[%s] %s", name, line.decode(errors='replace').rstrip())
+    
+    def _classify_failure(self, stderr: str, returncode: Optional[int]) -> Optional[str]:
+        """
+        Classify a failed gallery-dl run as a FAILURE_RESPONSES kind or 'retry'.
+        
+        gallery-dl logs each failure as "[category][error] ExceptionName: ..."
+        and ORs per-exception codes into its exit status. The logged errors
+        are the most specific signal, then free-text keywords; the exit
+        status bits only decide when neither says anything.
+        
+        Args:
+            stderr: Decoded stderr tail
+            returncode: gallery-dl exit status, if the process ran
+            
+        Returns:
+            'auth', 'not_found', 'unsupported', 'retry' or None
+        """
+        for match in GDL_ERROR_RE.finditer(stderr):
+            exc_name, message = match.group('exc'), match.group('message')
+            if exc_name in GDL_ERROR_KINDS:
+                return GDL_ERROR_KINDS[exc_name]
+            if exc_name == 'HttpError' or exc_name == 'ChallengeError':
+                status = HTTP_STATUS_RE.search(message)
+                if status:
+                    code = int(status.group(1))
+                    if code in HTTP_STATUS_KINDS:
+                        return HTTP_STATUS_KINDS[code]
+                    if code >= 500:
+                        return 'retry'
+            elif message.startswith('Unsupported URL'):
+                return 'unsupported'
+            elif message.startswith(('Unable to download data', 'Failed to download')):
+                # Connection failures and files that failed after gallery-dl's own retries
+                return 'retry'
+        
+        # Unstructured output (unexpected gallery-dl build or wrapper script):
+        # one case-insensitive sweep collects every keyword kind present
+        keywords = {match.lastgroup for match in FAILURE_KEYWORDS_RE.finditer(stderr)}
+        if 'auth' in keywords:
+            return 'auth'
+        if 'not_found' in keywords:
+            return 'not_found'
+        if 'retry' in keywords:
+            return 'retry'
+        
+        # Last resort: the exit status, a bitmask of exception codes. Bit 4
+        # (ExtractionError, HttpError, failed files) says nothing about why,
+        # so it's left unclassified rather than read as "nothing found"
+        if returncode is not None and returncode > 0:
+            if returncode & GDL_EXIT_AUTH:
+                return 'auth'
+            if returncode & GDL_EXIT_OSERROR:
+                return 'retry'
+            if returncode & (GDL_EXIT_INPUT | GDL_EXIT_NO_EXTRACTOR):
+                return 'unsupported'
+        return None
+    
+    @staticmethod
+    def _stderr_tail(stderr: bytes) -> str:
+        """Decode the last STDERR_TAIL_BYTES of stderr, where the actual error is."""
+        return stderr[-STDERR_TAIL_BYTES:].decode(errors='replace')
+    
     def _is_retryable_error(self, stderr: str) -> bool:
         """Check if error is retryable."""
-        retryable_keywords = [
-            'timeout',
-            'connection',
-            'network',
-            'temporary',
-            'rate limit',
-            'try again'
-        ]
-        stderr_lower = stderr.lower()
-        return any(keyword in stderr_lower for keyword in retryable_keywords)
+        return RETRYABLE_RE.search(stderr) is not None
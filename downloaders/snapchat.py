@@ -2,11 +2,70 @@
 
 import os
 import time
+import shutil
 import logging
+import threading
 import requests
-from typing import Dict, List, Optional
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from typing import Callable, Dict, Optional
 
-from core.rate_limiter import RateLimiter
+from core.rate_limiter import TokenBucket
+
+# orjson (optional - faster parsing of long story lists)
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# Concurrent story downloads per request
+MAX_MEDIA_WORKERS = 8
+
+# Read size when copying media to disk
+MEDIA_CHUNK_SIZE = 1024 * 1024
+
+# Back-off when a 429 carries no usable Retry-After (seconds)
+DEFAULT_RETRY_AFTER = 2.0
+
+# Output directories already created by an earlier downloader in this process
+_ensured_dirs: set = set()
+
+# API origins a connection has already been opened to in this process
+_warmed_origins: set = set()
+
+# Shared by every SnapchatDownloader so warm connections outlive instances
+_session: Optional[requests.Session] = None
+_session_lock = threading.Lock()
+
+
+def _get_session() -> requests.Session:
+    """Return the process-wide HTTP session, creating it on first use."""
+    global _session
+    with _session_lock:
+        if _session is None:
+            session = requests.Session()
+            session.headers.update({
+                'User-Agent': 'StoryFlow/1.0',
+                'Accept': 'application/json',
+                'Content-Type': 'application/json'
+            })
+            # Enough pooled connections for every download worker; 429/5xx
+            # are retried by urllib3 (honouring Retry-After), and the last
+            # response is returned as-is so the API's JSON errors still parse.
+            # The story lookup POST is read-only, so it's safe to repeat.
+            retry = Retry(
+                total=3,
+                backoff_factor=0.5,
+                status_forcelist=(429, 500, 502, 503, 504),
+                allowed_methods=Retry.DEFAULT_ALLOWED_METHODS | {'POST'},
+                raise_on_status=False
+            )
+            adapter = HTTPAdapter(pool_connections=32, pool_maxsize=32, max_retries=retry)
+            session.mount('https://', adapter)
+            session.mount('http://', adapter)
+            _session = session
+        return _session
 
 
 class SnapchatDownloader:
@@ -22,34 +81,57 @@ class SnapchatDownloader:
         """
         self.api_base_url = api_base_url.rstrip('/')
         self.output_path = output_path
-        self.rate_limiter = RateLimiter(
-            max_requests=int(os.getenv('MAX_REQUESTS_PER_MINUTE', 30))
-        )
-        self.session = requests.Session()
-        self.session.headers.update({
-            'User-Agent': 'StoryFlow/1.0',
-            'Accept': 'application/json',
-            'Content-Type': 'application/json'
-        })
+        max_per_minute = int(os.getenv('MAX_REQUESTS_PER_MINUTE', 30))
+        self.rate_limiter = TokenBucket(rate=max_per_minute / 60.0, capacity=max_per_minute)
+        self.session = _get_session()
+        
+        # Ensure output directory exists (once per process)
+        if output_path not in _ensured_dirs:
+            os.makedirs(output_path, exist_ok=True)
+            _ensured_dirs.add(output_path)
         
-        # Ensure output directory exists
-        os.makedirs(output_path, exist_ok=True)
+        self._warm_up()
     
-    def download_stories(self, username: str) -> Dict:
+    def _warm_up(self) -> None:
+        """
+        Connect to the API in the background, once per process and API origin.
+        
+        The first story lookup then finds DNS, TCP and TLS already done and
+        reuses the pooled keep-alive connection.
+        """
+        with _session_lock:
+            if self.api_base_url in _warmed_origins:
+                return
+            _warmed_origins.add(self.api_base_url)
+        threading.Thread(target=self._connect_api, name='snapchat-warmup', daemon=True).start()
+    
+    def _connect_api(self) -> None:
+        try:
+            self.session.head(self.api_base_url, timeout=10, allow_redirects=False).close()
+        except requests.exceptions.RequestException as e:
+            logging.debug("Snapchat API warm-up failed: %s", e)
+    
+    def download_stories(
+        self,
+        username: str,
+        on_file: Optional[Callable[[str], None]] = None
+    ) -> Dict:
         """
         Download all Snapchat stories for a username.
         
         Args:
             username: Snapchat username
+            on_file: Optional callback invoked with each file path as soon as
+                it has been downloaded (lets callers start uploading early)
             
         Returns:
             Dict containing status and download information
         """
-        self.rate_limiter.wait_if_needed()
+        self.rate_limiter.acquire()
         
         try:
             # Fetch story metadata from API
-            logging.info(f"📡 Fetching stories for @{username}...")
+            logging.info("📡 Fetching stories for @%s...", username)
             stories_data = self._fetch_stories(username)
             
             if not stories_data.get('status'):
@@ -72,30 +154,41 @@ class SnapchatDownloader:
                     'files': []
                 }
             
-            logging.info(f"📸 Found {count} stories for @{username}")
+            logging.info("📸 Found %s stories for @%s", count, username)
             
-            # Download each story
-            downloaded_files = []
-            for i, story in enumerate(stories, 1):
-                media_url = story.get('mediaUrl')
-                media_type = story.get('mediaType', 0)  # 0=image, 1=video
-                timestamp = story.get('timestamp', '')
-                
-                if not media_url:
-                    logging.warning(f"⚠️ Story {i} has no media URL, skipping")
-                    continue
+            # Download stories concurrently; each is an independent GET, so
+            # handshake latency overlaps instead of adding up
+            results = {}
+            with ThreadPoolExecutor(max_workers=min(MAX_MEDIA_WORKERS, len(stories) or 1)) as executor:
+                futures = {}
+                for i, story in enumerate(stories, 1):
+                    media_url = story.get('mediaUrl')
+                    
+                    if not media_url:
+                        logging.warning("⚠️ Story %s has no media URL, skipping", i)
+                        continue
+                    
+                    future = executor.submit(
+                        self._download_media,
+                        media_url=media_url,
+                        username=username,
+                        index=i,
+                        media_type=story.get('mediaType', 0),  # 0=image, 1=video
+                        timestamp=story.get('timestamp', '')
+                    )
+                    futures[future] = i
                 
-                filename = self._download_media(
-                    media_url=media_url,
-                    username=username,
-                    index=i,
-                    media_type=media_type,
-                    timestamp=timestamp
-                )
-                
-                if filename:
-                    downloaded_files.append(filename)
-                    logging.info(f"✅ Downloaded story {i}/{count}: {os.path.basename(filename)}")
+                for future in as_completed(futures):
+                    i = futures[future]
+                    filename = future.result()
+                    if filename:
+                        results[i] = filename
+                        if on_file:
+                            on_file(filename)
+                        logging.info("✅ Downloaded story %s/%s: %s", i, count, os.path.basename(filename))
+            
+            # Report files in story order, whatever order they finished in
+            downloaded_files = [results[i] for i in sorted(results)]
             
             return {
                 'success': True,
@@ -107,7 +200,7 @@ class SnapchatDownloader:
             }
             
         except requests.exceptions.HTTPError as e:
-            logging.error(f"❌ HTTP Error {e.response.status_code}: {e.response.text}")
+            logging.error("❌ HTTP Error %s: %s", e.response.status_code, e.response.text)
             return {
                 'success': False,
                 'error': f"HTTP {e.response.status_code}",
@@ -116,7 +209,7 @@ class SnapchatDownloader:
             }
             
         except requests.exceptions.RequestException as e:
-            logging.error(f"❌ Network error: {e}")
+            logging.error("❌ Network error: %s", e)
             return {
                 'success': False,
                 'error': 'Network error',
@@ -125,7 +218,7 @@ class SnapchatDownloader:
             }
             
         except Exception as e:
-            logging.error(f"❌ Unexpected error: {e}")
+            logging.error("❌ Unexpected error: %s", e)
             return {
                 'success': False,
                 'error': 'Unexpected error',
@@ -137,16 +230,23 @@ class SnapchatDownloader:
         """Fetch stories metadata from SnapStory DL API."""
         endpoint = f"{self.api_base_url}/story"
         
-        response = self.session.post(
-            endpoint,
-            json={'username': username},
-            timeout=30
-        )
+        # The session already sends Content-Type: application/json
+        if orjson:
+            response = self.session.post(endpoint, data=orjson.dumps({'username': username}), timeout=30)
+        else:
+            response = self.session.post(endpoint, json={'username': username}, timeout=30)
+        
+        # Still rate limited once urllib3's Retry-After retries ran out: make
+        # the next API call wait as long as the server asked
+        if response.status_code == 429:
+            delay = self._retry_after(response)
+            logging.warning("⏳ Snapchat API rate limited, holding requests for %.0fs", delay)
+            self.rate_limiter.defer(delay)
         
         # Parse JSON response even for error status codes
         # The API returns meaningful JSON for 400 errors
         try:
-            data = response.json()
+            data = orjson.loads(response.content) if orjson else response.json()
         except Exception:
             # If JSON parsing fails, raise the HTTP error
             response.raise_for_status()
@@ -156,6 +256,17 @@ class SnapchatDownloader:
         # Don't raise_for_status, just return the parsed data
         return data
     
+    @staticmethod
+    def _retry_after(response: requests.Response) -> float:
+        """Seconds a 429 response asks to wait (Retry-After seconds or HTTP date)."""
+        value = response.headers.get('Retry-After')
+        if value:
+            try:
+                return Retry().parse_retry_after(value)
+            except Exception:
+                pass
+        return DEFAULT_RETRY_AFTER
+    
     def _download_media(
         self,
         media_url: str,
@@ -176,16 +287,38 @@ class SnapchatDownloader:
                 f"snapchat_{username}_{ts}_{index}.{extension}"
             )
             
-            # Download file
-            response = self.session.get(media_url, stream=True, timeout=60)
-            response.raise_for_status()
+            # A story the API timestamped is the same media every time it's
+            # listed; finished files are only ever created by the rename below
+            if timestamp and os.path.isfile(filename) and os.path.getsize(filename) > 0:
+                logging.info("⏭️ Story %s already downloaded, skipping", index)
+                return filename
             
-            with open(filename, 'wb') as f:
-                for chunk in response.iter_content(chunk_size=8192):
-                    f.write(chunk)
+            # Download file; media is already compressed, so ask for it as-is
+            part_file = filename + '.part'
+            with self.session.get(
+                media_url,
+                headers={'Accept-Encoding': 'identity'},
+                stream=True,
+                timeout=60
+            ) as response:
+                response.raise_for_status()
+                
+                # Copy straight from the socket in 1 MiB reads
+                response.raw.decode_content = True
+                try:
+                    with open(part_file, 'wb') as f:
+                        shutil.copyfileobj(response.raw, f, length=MEDIA_CHUNK_SIZE)
+                    os.replace(part_file, filename)
+                except BaseException:
+                    # Don't leave a truncated file behind
+                    try:
+                        os.remove(part_file)
+                    except OSError:
+                        pass
+                    raise
             
             return filename
             
         except Exception as e:
-            logging.error(f"❌ Failed to download media: {e}")
+            logging.error("❌ Failed to download media: %s", e)
             return None
@@ -9,12 +9,18 @@ A Python CLI tool for downloading stories and media from:
 
 import os
 import sys
+import asyncio
 import logging
+import threading
+from typing import Optional
 from dotenv import load_dotenv
 
 from core.platform import identify_platform, extract_snapchat_username
 from downloaders.snapchat import SnapchatDownloader
-from downloaders.gallery_dl import GalleryDLDownloader
+from downloaders.gallery_dl import GalleryDLDownloader, GDL_STALL_TIMEOUT
+
+# Inputs that end the CLI session
+QUIT_COMMANDS = ('quit', 'exit', 'q')
 
 
 def setup_logging():
@@ -54,8 +60,7 @@ def format_result(result: dict) -> None:
             print(f"   📸 Stories: {result.get('downloaded', 0)}/{result['total_stories']}")
         if result.get('files'):
             print(f"   📁 Files:")
-            for f in result['files']:
-                print(f"      • {os.path.basename(f)}")
+            sys.stdout.writelines(f"      • {os.path.basename(f)}\n" for f in result['files'])
         if result.get('message'):
             print(f"   ℹ️  {result['message']}")
     else:
@@ -69,6 +74,118 @@ def format_result(result: dict) -> None:
             print("   file in the ./cookies directory as 'instagram.txt'")
 
 
+def _read_urls(loop: asyncio.AbstractEventLoop, urls: asyncio.Queue) -> None:
+    """Prompt for URLs on a daemon thread and hand each line to the event loop."""
+    while True:
+        try:
+            line = input("📎 Enter URL: ").strip()
+        except EOFError:
+            line = None
+        loop.call_soon_threadsafe(urls.put_nowait, line)
+        if line is None or line.lower() in QUIT_COMMANDS:
+            return
+
+
+async def _download_snapchat(url: str, platform: str, snapchat: SnapchatDownloader, gallery_dl: GalleryDLDownloader) -> Optional[dict]:
+    """Download a Snapchat user's stories."""
+    # Extract username from URL
+    username = extract_snapchat_username(url)
+    if not username:
+        print("❌ Could not extract username from Snapchat URL")
+        print("   Expected format: snapchat.com/add/username")
+        return None
+    
+    print(f"\n🔄 Fetching stories for @{username}...")
+    return await asyncio.to_thread(snapchat.download_stories, username)
+
+
+async def _download_gallery(url: str, platform: str, snapchat: SnapchatDownloader, gallery_dl: GalleryDLDownloader) -> Optional[dict]:
+    """Download a post/video through gallery-dl."""
+    print(f"\n🔄 Downloading {platform} content...")
+    return await gallery_dl.download(url, platform)
+
+
+# Downloader for each platform identify_platform() can return
+PLATFORM_HANDLERS = {
+    "Snapchat": _download_snapchat,
+    "Instagram": _download_gallery,
+    "TikTok": _download_gallery,
+    "Twitter": _download_gallery,
+    "Facebook": _download_gallery,
+}
+
+
+async def handle_url(url: str, snapchat: SnapchatDownloader, gallery_dl: GalleryDLDownloader) -> Optional[dict]:
+    """
+    Download one URL with the matching downloader.
+    
+    Returns:
+        Download result, or None if the URL was rejected (reason already printed)
+    """
+    # Identify platform
+    platform = identify_platform(url)
+    
+    handler = PLATFORM_HANDLERS.get(platform)
+    if handler is not None:
+        return await handler(url, platform, snapchat, gallery_dl)
+    
+    if platform == "Unknown":
+        print("\n🚫 Unsupported platform.")
+        print("   Supported: Snapchat, Instagram, TikTok, Twitter/X, Facebook")
+    elif platform == "Error":
+        print("\n❌ Invalid URL format.")
+        print("   Please enter a complete URL (e.g., https://...)")
+    else:
+        print(f"\n⚠️ Unexpected platform: {platform}")
+    return None
+
+
+async def _download_and_report(url: str, snapchat: SnapchatDownloader, gallery_dl: GalleryDLDownloader) -> None:
+    """Download one URL and print its result; errors are reported, never raised."""
+    try:
+        result = await handle_url(url, snapchat, gallery_dl)
+        if result is not None:
+            # Display result
+            format_result(result)
+            print()  # Empty line for readability
+    
+    except Exception as e:
+        logging.error(f"Unexpected error: {e}", exc_info=True)
+        print(f"\n⚠️ An error occurred: {e}")
+        print("   Please try again.\n")
+
+
+async def cli_loop(snapchat: SnapchatDownloader, gallery_dl: GalleryDLDownloader) -> None:
+    """
+    Read URLs and download them concurrently.
+    
+    Input is read on a daemon thread so the next URL can be typed (or a batch
+    pasted) while earlier ones download. Quitting waits for pending downloads.
+    """
+    urls: asyncio.Queue = asyncio.Queue()
+    threading.Thread(target=_read_urls, args=(asyncio.get_running_loop(), urls), daemon=True).start()
+    
+    async with asyncio.TaskGroup() as downloads:
+        while True:
+            url = await urls.get()
+            
+            # Check exit condition
+            if url is None or url.lower() in QUIT_COMMANDS:
+                break
+            
+            if not url:
+                continue
+            
+            # Validate URL format
+            if not url.startswith(('http://', 'https://')):
+                print("❌ Invalid URL. Please enter a complete URL (https://...)")
+                continue
+            
+            downloads.create_task(_download_and_report(url, snapchat, gallery_dl))
+    
+    print("\n👋 Goodbye!")
+
+
 def main_cli():
     """Main CLI execution loop."""
     # Load environment variables
@@ -90,74 +207,18 @@ def main_cli():
     
     gallery_dl = GalleryDLDownloader(
         output_path=download_path,
-        cookie_path=cookie_path
+        cookie_path=cookie_path,
+        in_process=os.getenv('GALLERY_DL_IN_PROCESS', '').lower() in ('1', 'true', 'yes'),
+        stall_timeout=float(os.getenv('GDL_STALL_TIMEOUT', GDL_STALL_TIMEOUT))
     )
     
     # Print welcome banner
     print_banner()
     
-    while True:
-        try:
-            # Get user input
-            url = input("📎 Enter URL: ").strip()
-            
-            # Check exit condition
-            if url.lower() in ['quit', 'exit', 'q']:
-                print("\n👋 Goodbye!")
-                break
-            
-            if not url:
-                continue
-            
-            # Validate URL format
-            if not url.startswith(('http://', 'https://')):
-                print("❌ Invalid URL. Please enter a complete URL (https://...)")
-                continue
-            
-            # Identify platform
-            platform = identify_platform(url)
-            
-            # Handle different platforms
-            if platform == "Snapchat":
-                # Extract username from URL
-                username = extract_snapchat_username(url)
-                if not username:
-                    print("❌ Could not extract username from Snapchat URL")
-                    print("   Expected format: snapchat.com/add/username")
-                    continue
-                
-                print(f"\n🔄 Fetching stories for @{username}...")
-                result = snapchat.download_stories(username)
-                
-            elif platform in ["Instagram", "TikTok", "Twitter", "Facebook"]:
-                print(f"\n🔄 Downloading {platform} content...")
-                result = gallery_dl.download(url, platform)
-                
-            elif platform == "Unknown":
-                print("\n🚫 Unsupported platform.")
-                print("   Supported: Snapchat, Instagram, TikTok, Twitter/X, Facebook")
-                continue
-                
-            elif platform == "Error":
-                print("\n❌ Invalid URL format.")
-                print("   Please enter a complete URL (e.g., https://...)")
-                continue
-            else:
-                print(f"\n⚠️ Unexpected platform: {platform}")
-                continue
-            
-            # Display result
-            format_result(result)
-            print()  # Empty line for readability
-                
-        except KeyboardInterrupt:
-            print("\n\n👋 Goodbye!")
-            break
-            
-        except Exception as e:
-            logging.error(f"Unexpected error: {e}", exc_info=True)
-            print(f"\n⚠️ An error occurred: {e}")
-            print("   Please try again.\n")
+    try:
+        asyncio.run(cli_loop(snapchat, gallery_dl))
+    except KeyboardInterrupt:
+        print("\n\n👋 Goodbye!")
 
 def main_telegram():
     """Run Telegram bot mode."""